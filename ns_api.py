@@ -1,16 +1,21 @@
 """Library to query the official Dutch railways API."""
 
+import bisect
+import codecs
 import collections
-import http.client
+import contextlib
+import functools
+import itertools
 import json
+import math
+import os
+import re
+import struct
+import threading
 import time
-import urllib.parse
-from datetime import datetime, timedelta
+import zlib
+from datetime import datetime, timedelta, timezone, tzinfo
 from enum import Enum
-from typing import Type
-
-import pytz
-from pytz.tzinfo import StaticTzInfo
 
 # ns-api library version
 __version__ = '3.2.1'
@@ -52,6 +57,29 @@ def simple_time(value):
 ###################
 
 
+@functools.lru_cache(maxsize=None)
+def get_timezone(zone_name):
+    """Return the timezone with this name, like 'Europe/Amsterdam'.
+
+    Uses the zoneinfo module of the standard library; pytz is only needed when no timezone database can be found.
+
+    :param str zone_name: IANA name of the timezone
+    :rtype: tzinfo
+    """
+    import zoneinfo
+
+    try:
+        return zoneinfo.ZoneInfo(zone_name)
+    except zoneinfo.ZoneInfoNotFoundError:
+        try:
+            import pytz
+        except ImportError:
+            raise zoneinfo.ZoneInfoNotFoundError(
+                'No timezone database found for {0}; install tzdata or pytz'.format(zone_name)
+            ) from None
+        return pytz.timezone(zone_name)
+
+
 def is_dst(zone_name):
     """Find out whether it's Daylight Saving Time in this timezone.
 
@@ -59,12 +87,10 @@ def is_dst(zone_name):
     :return: True when DST, False otherwise
     :rtype: bool
     """
-    tz = pytz.timezone(zone_name)
-    now = pytz.utc.localize(datetime.utcnow())
-    return now.astimezone(tz).dst() != timedelta(0)
+    return datetime.now(timezone.utc).astimezone(get_timezone(zone_name)).dst() != timedelta(0)
 
 
-class OffsetTime(StaticTzInfo):
+class OffsetTime(tzinfo):
     """A dumb timezone based on offset such as +0530, -0600, etc."""
 
     def __init__(self, offset):
@@ -75,10 +101,70 @@ class OffsetTime(StaticTzInfo):
         hours = int(offset[:3])
         minutes = int(offset[0] + offset[3:])
         self._utcoffset = timedelta(hours=hours, minutes=minutes)
+        self._offset = offset
+
+    def utcoffset(self, dt):
+        """Return the offset from UTC."""
+        return self._utcoffset
+
+    def dst(self, dt):
+        """Return the Daylight Saving Time adjustment, which a fixed offset does not have."""
+        return timedelta(0)
+
+    def tzname(self, dt):
+        """Return the name of the timezone, which a fixed offset does not have."""
+        return None
+
+    def localize(self, dt, is_dst=False):
+        """Attach this timezone to a naive datetime, like pytz timezones do."""
+        return dt.replace(tzinfo=self)
+
+    def normalize(self, dt, is_dst=False):
+        """Convert an aware datetime to this timezone, like pytz timezones do."""
+        if dt.tzinfo is self:
+            return dt
+        return dt.astimezone(self)
+
+    def __repr__(self):
+        """Return the representation of this timezone."""
+        return '<OffsetTime {0}>'.format(self._offset)
+
+    def __reduce__(self):
+        """Pickle as the offset, so unpickling gives the shared instance for that offset."""
+        return offset_timezone, (self._offset,)
+
+
+@functools.lru_cache(maxsize=None)
+def offset_timezone(offset):
+    """Return the shared timezone object for an offset such as +0200 or +02:00.
+
+    :param str offset: The timezone offset to use
+    :rtype: OffsetTime
+    """
+    return OffsetTime(offset.replace(':', ''))
+
+
+def parse_ns_datetime(value):
+    """Create timezone-aware datetime object from an NS API timestamp, like 2024-01-31T12:34:00+0100.
+
+    Much faster than parsing with datetime.strptime. Also accepts the output of datetime.isoformat(), which has a
+    colon in the offset and possibly microseconds.
+
+    :param str value: timestamp in NS_DATETIME format
+    :rtype: datetime
+    """
+    if len(value) > 19:
+        if value[-3] == ':' and value[-6] in '+-':
+            return datetime.fromisoformat(value[:-6]).replace(tzinfo=offset_timezone(value[-6:]))
+        if value[-5] in '+-':
+            return datetime.fromisoformat(value[:-5]).replace(tzinfo=offset_timezone(value[-5:]))
+    return datetime.fromisoformat(value)
 
 
 def load_datetime(value, dt_format):
     """Create timezone-aware datetime object."""
+    if dt_format == NS_DATETIME:
+        return parse_ns_datetime(value)
     if dt_format.endswith('%z'):
         dt_format = dt_format[:-2]
         offset = value[-5:]
@@ -87,26 +173,66 @@ def load_datetime(value, dt_format):
             # strip : from HHMM if needed (isoformat() adds it between HH and MM)
             offset = '+' + offset.replace(':', '')
             value = value[:-1]
-        return OffsetTime(offset).localize(datetime.strptime(value, dt_format))
+        return offset_timezone(offset).localize(datetime.strptime(value, dt_format))
 
     return datetime.strptime(value, dt_format)
 
 
+# Timezone the NS API expects local times in
+NS_TIMEZONE = 'Europe/Amsterdam'
+
+
+@functools.lru_cache(maxsize=512)
+def _day_offsets(zone_name, day):
+    """Return the timezone for each hour of a local date, which only differ on the days DST starts or ends.
+
+    :param str zone_name: IANA name of the timezone
+    :param date day: the local date
+    :return: 24 OffsetTime objects
+    :rtype: tuple
+    """
+    zone = get_timezone(zone_name)
+    # pytz timezones (the fallback of get_timezone) need localize() to pick the right offset
+    localize = getattr(zone, 'localize', None)
+    offsets = []
+    for hour in range(24):
+        local_time = datetime(day.year, day.month, day.day, hour)
+        aware = localize(local_time, is_dst=True) if localize else local_time.replace(tzinfo=zone)
+        minutes = int(aware.utcoffset().total_seconds()) // 60
+        sign = '-' if minutes < 0 else '+'
+        offsets.append(offset_timezone('{0}{1:02d}{2:02d}'.format(sign, *divmod(abs(minutes), 60))))
+    return tuple(offsets)
+
+
+def local_offset_timezone(value, zone_name=NS_TIMEZONE):
+    """Return the fixed-offset timezone that applies to a local date and time in a timezone, like +0200 in summer.
+
+    The offsets are worked out once per date. Of a time that occurs twice when DST ends, the first is taken.
+
+    :param datetime value: naive local date and time
+    :param str zone_name: IANA name of the timezone
+    :rtype: OffsetTime
+    """
+    return _day_offsets(zone_name, value.date())[value.hour]
+
+
 ###############
 # List helpers
 ###############
 
 
-def list_to_json(source_list):
+def list_to_json(source_list, nested=False):
     """Serialise all the items in source_list to JSON.
 
     :param list source_list: List of items to serialise
+    :param bool nested: serialise nested models (like the parts of a Trip) as part of the JSON of each item, instead
+        of as JSON strings inside it
     :return: Serialised list of items
     :rtype: list
     """
     result = []
     for item in source_list:
-        result.append(item.to_json())
+        result.append(item.to_json(nested=nested))
     return result
 
 
@@ -143,28 +269,59 @@ def list_from_json(source_list_json):
             case _:
                 print('Unrecognised Class {}, skipping'.format(item['class_name']))
                 continue
-        # Now parse the JSON to the actual object
-        temp_object.from_json(list_item)
+        # Now restore the actual object from the already decoded JSON
+        temp_object.__setstate__(item)
         result.append(temp_object)
     return result
 
 
+def _membership(items):
+    """Return a container to look items up in; a set when all items are hashable, a list otherwise."""
+    try:
+        return set(items)
+    except TypeError:
+        return list(items)
+
+
+def list_to_bytes(source_list):
+    """Serialise all the items in source_list to one binary document.
+
+    Faster and more compact than list_to_json, and datetimes and enums are kept as they are. The document is a
+    pickle, so only ever load it with list_from_bytes from a trusted source, like your own cache.
+
+    :param list source_list: List of items to serialise
+    :return: Serialised list of items
+    :rtype: bytes
+    """
+    import pickle
+
+    return pickle.dumps(list(source_list), protocol=5)
+
+
+def list_from_bytes(source_list_bytes):
+    """Deserialise all the items from a document created with list_to_bytes.
+
+    :param bytes source_list_bytes: Serialised list of items
+    :return: Deserialised list of items
+    :rtype: list
+    """
+    import pickle
+
+    if not source_list_bytes:
+        return []
+    return pickle.loads(source_list_bytes)
+
+
 def list_diff(list_a, list_b):
     """Return the items from list_b that differ from list_a."""
-    result = []
-    for item in list_b:
-        if item not in list_a:
-            result.append(item)
-    return result
+    lookup = _membership(list_a)
+    return [item for item in list_b if item not in lookup]
 
 
 def list_same(list_a, list_b):
     """Return the items from list_b that are also on list_a."""
-    result = []
-    for item in list_b:
-        if item in list_a:
-            result.append(item)
-    return result
+    lookup = _membership(list_a)
+    return [item for item in list_b if item in lookup]
 
 
 def list_merge(list_a, list_b):
@@ -175,23 +332,47 @@ def list_merge(list_a, list_b):
     :returns: New list with deduplicated items from list_a and list_b
     :rtype: list
     """
-    # return list(collections.OrderedDict.fromkeys(list_a + list_b))
     result = []
-    for item in list_a:
-        if item not in result:
-            result.append(item)
-    for item in list_b:
-        if item not in result:
-            result.append(item)
+    try:
+        seen = set()
+        for item in itertools.chain(list_a, list_b):
+            if item not in seen:
+                seen.add(item)
+                result.append(item)
+    except TypeError:
+        # Unhashable items, compare them one by one
+        result = []
+        for item in itertools.chain(list_a, list_b):
+            if item not in result:
+                result.append(item)
     return result
 
 
+def state_changes(old, new):
+    """Compare two versions of a model, attribute by attribute.
+
+    :param BaseObject old: previous version of the model
+    :param BaseObject new: current version of the model
+    :return: the changed attributes, mapped to their (old, new) values; None for unset attributes
+    :rtype: dict
+    """
+    old_state = old._state()
+    new_state = new._state()
+    changes = {}
+    for name in itertools.chain(old_state, (name for name in new_state if name not in old_state)):
+        old_value = old_state.get(name)
+        new_value = new_state.get(name)
+        if old_value != new_value:
+            changes[name] = (old_value, new_value)
+    return changes
+
+
 ###############
 # Enum helpers
 ###############
 
 
-def parse_enum(enum_class: Type[Enum], value) -> Enum | str | None:
+def parse_enum(enum_class: type[Enum], value) -> Enum | str | None:
     """Parse value to enum, or return raw value if unknown."""
     if value is None or isinstance(value, enum_class):
         return value
@@ -218,6 +399,143 @@ class NoDataReceivedError(Exception):
     pass
 
 
+#################
+# JSON streaming
+#################
+
+
+JSON_STREAM_CHUNK_SIZE = 64 * 1024
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def _read_chunks(stream, size=JSON_STREAM_CHUNK_SIZE):
+    """Yield chunks read from a file-like object until it returns an empty one, either b'' or '' in text mode."""
+    while chunk := stream.read(size):
+        yield chunk
+
+
+class JSONStreamReader:
+    """Reads JSON values one by one from a stream of text or bytes chunks, without loading the whole document."""
+
+    def __init__(self, stream):
+        """Construct a JSONStreamReader object.
+
+        :param stream: file-like object with a read() method, an iterable of str or bytes chunks, or a str or bytes
+        """
+        if isinstance(stream, (str, bytes)):
+            stream = [stream]
+        elif hasattr(stream, 'read'):
+            stream = _read_chunks(stream)
+        self._chunks = iter(stream)
+        self._utf8 = codecs.getincrementaldecoder('UTF-8')()
+        self._decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def _fill(self):
+        """Append the next chunk of the stream to the buffer.
+
+        :return: False when the end of the stream was reached
+        :rtype: bool
+        """
+        if self.exhausted:
+            return False
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                self.buffer = self.buffer[self.pos :] + text
+                self.pos = 0
+                return True
+        self.exhausted = True
+        self.buffer = self.buffer[self.pos :] + self._utf8.decode(b'', final=True)
+        self.pos = 0
+        return False
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it, or an empty string at the end."""
+        while True:
+            self.pos = _JSON_WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        """Consume the next non-whitespace character, which has to be char.
+
+        :raises:
+            - ValueError when another character is found
+        """
+        found = self.peek()
+        if found != char:
+            raise ValueError('Expected {0!r} but found {1!r} in JSON stream'.format(char, found))
+        self.pos += 1
+
+    def value(self):
+        """Decode and consume the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+                # A number at the very end of the buffer might continue in the next chunk
+                if end < len(self.buffer) or self.exhausted:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self._fill()
+
+    def _iter_items(self):
+        """Yield the items of the array at the current position, consuming the array."""
+        self.expect('[')
+        if self.peek() != ']':
+            while True:
+                yield self.value()
+                if self.peek() != ',':
+                    break
+                self.pos += 1
+        self.expect(']')
+
+    def iter_array(self, path, skipped=None):
+        """Yield the items of the array found at path, decoding them one at a time.
+
+        Reading stops right after the array, so the remainder of the stream is left unread.
+
+        :param tuple path: keys of the nested objects leading to the array, like ('payload', 'departures')
+        :param dict skipped: optional dictionary that receives the other top-level values read along the way
+        :raises:
+            - NoDataReceivedError when the stream is empty, or has nothing at path
+        """
+        if self.peek() == '':
+            raise NoDataReceivedError('No data was returned')
+        self.expect('{')
+        while self.peek() != '}':
+            key = self.value()
+            self.expect(':')
+            if key == path[0]:
+                if len(path) > 1:
+                    if self.peek() != '{':
+                        raise NoDataReceivedError('No {0} were returned'.format(path[-1]))
+                    yield from self.iter_array(path[1:])
+                elif self.peek() == '[':
+                    yield from self._iter_items()
+                else:
+                    # Not an array (for example null), so there are no items
+                    self.value()
+                return
+            value = self.value()
+            if skipped is not None:
+                skipped[key] = value
+            if self.peek() != ',':
+                break
+            self.pos += 1
+        self.expect('}')
+        raise NoDataReceivedError('No {0} were returned'.format(path[-1]))
+
+
 #################
 # NS API objects
 #################
@@ -255,26 +573,119 @@ class CrowdForecast(Enum):
         return self.value
 
 
+@functools.lru_cache(maxsize=None)
+def slot_names(cls):
+    """Return the names of all slots of a class, including those of its base classes.
+
+    :param type cls: class to inspect
+    :rtype: tuple
+    """
+    names = []
+    for klass in reversed(cls.__mro__):
+        for name in klass.__dict__.get('__slots__', ()):
+            if name not in ('__dict__', '__weakref__') and name not in names:
+                names.append(name)
+    return tuple(names)
+
+
+_MISSING = object()
+
+
+def _restore_model(cls, state):
+    """Recreate a model from the state it was pickled with."""
+    model = cls.__new__(cls)
+    for name, value in state.items():
+        setattr(model, name, value)
+    return model
+
+
 class BaseObject:
-    """Base object with useful functions."""
+    """Base object with useful functions.
+
+    The models keep their attributes in __slots__ to stay small when many of them are kept in memory; only the
+    public attributes that have been set are part of the state of a model.
+
+    Models hash on the attributes in _key_fields, which identify an instance (like the key of a Departure), so they
+    can be put in sets and dictionaries. Equality still compares the complete state.
 
-    def __getstate__(self):
-        """Get the object as a dictionary."""
-        result = self.__dict__.copy()
+    For JSON, the attributes in _datetime_fields are serialised as ISO 8601 strings, those in _timedelta_fields as
+    seconds and enums as their value.
+    """
+
+    __slots__ = ()
+    _key_fields = ()
+    _datetime_fields = ()
+    _timedelta_fields = ()
+
+    def _state(self):
+        """Get the attributes of the object as a dictionary."""
+        result = {}
+        for name in slot_names(self.__class__):
+            if name.startswith('_'):
+                # Internal bookkeeping, not part of the model
+                continue
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                result[name] = value
+        if hasattr(self, '__dict__'):
+            # Subclasses without __slots__
+            result.update(self.__dict__)
+        return result
+
+    def __getstate__(self, nested=False):
+        """Get the object as a dictionary that can be serialised to JSON.
+
+        :param bool nested: include nested models as dictionaries instead of as JSON strings
+        """
+        result = self._state()
+        for name, value in result.items():
+            if value is None:
+                continue
+            if name in self._datetime_fields:
+                result[name] = value.isoformat()
+            elif name in self._timedelta_fields:
+                result[name] = value.total_seconds()
+            elif isinstance(value, Enum):
+                result[name] = value.value
         result['class_name'] = self.__class__.__name__
         return result
 
-    def to_json(self):
-        """Create a JSON representation of this model."""
-        return json.dumps(self.__getstate__(), ensure_ascii=False)
+    def __reduce__(self):
+        """Pickle the attributes as they are, bypassing the JSON oriented __getstate__."""
+        return _restore_model, (self.__class__, self._state())
+
+    def to_json(self, nested=False):
+        """Create a JSON representation of this model.
+
+        :param bool nested: serialise nested models as part of one JSON document, instead of as JSON strings inside it
+        """
+        return json.dumps(self.__getstate__(nested=nested), ensure_ascii=False)
 
     def __setstate__(self, source_dict):
         """Restore the object from a dictionary representation."""
         if not source_dict:
             # Somehow the source is None
             return
-        del source_dict['class_name']
-        self.__dict__ = source_dict
+        source_dict.pop('class_name', None)
+        for name, value in source_dict.items():
+            if isinstance(value, str) and name in self._datetime_fields:
+                value = parse_ns_datetime(value)
+            elif isinstance(value, (int, float)) and name in self._timedelta_fields:
+                value = timedelta(seconds=value)
+            setattr(self, name, value)
+
+    @classmethod
+    def from_state(cls, state):
+        """Create a model from its state, either as dictionary or as JSON string (the format of older versions).
+
+        :param dict|str state: dictionary or JSON representation of the model
+        """
+        model = cls()
+        if isinstance(state, str):
+            model.from_json(state)
+        else:
+            model.__setstate__(state)
+        return model
 
     def from_json(self, source_json):
         """Parse a JSON representation of this model back to, well, the model."""
@@ -283,7 +694,13 @@ class BaseObject:
 
     def __eq__(self, other):
         """Compare this instance with another instance."""
-        return self.__dict__ == other.__dict__
+        if not isinstance(other, BaseObject):
+            return NotImplemented
+        return self._state() == other._state()
+
+    def __hash__(self):
+        """Hash this instance on the attributes identifying it."""
+        return hash((self.__class__.__name__, *(getattr(self, name, None) for name in self._key_fields)))
 
     def __repr__(self):
         """Return the string representation of this model."""
@@ -297,6 +714,22 @@ class BaseObject:
 class Station(BaseObject):
     """Information on a railway station."""
 
+    __slots__ = (
+        'eva_code',
+        'code',
+        'uic_code',
+        'station_type',
+        'names',
+        'country',
+        'lat',
+        'lon',
+        'synonyms',
+        'has_facilities',
+        'has_travel_assistance',
+        'has_departure_times',
+    )
+    _key_fields = ('code',)
+
     def __init__(self, stat_dict=None):
         """Construct a Station object.
 
@@ -337,6 +770,15 @@ class Station(BaseObject):
 class Disruption(BaseObject):
     """Planned and unplanned disruptions of the railroad traffic."""
 
+    __slots__ = (
+        'key',
+        'line',
+        'disruption',
+        'timestamp',
+    )
+    _key_fields = ('key',)
+    _datetime_fields = ('timestamp',)
+
     def __init__(self, part_dict=None):
         """Construct a Disruption object.
 
@@ -349,17 +791,6 @@ class Disruption(BaseObject):
         self.disruption = part_dict['verstoring']
         self.timestamp = None
 
-    def __getstate__(self):
-        """Get the object as a dictionary."""
-        result = super(Disruption, self).__getstate__()
-        result['timestamp'] = result['timestamp'].isoformat()
-        return result
-
-    def __setstate__(self, source_dict):
-        """Restore the object from a dictionary representation."""
-        super(Disruption, self).__setstate__(source_dict)
-        self.timestamp = load_datetime(self.timestamp, NS_DATETIME)
-
     def __str__(self):
         """Return the string representation of this model."""
         return '<Disruption> {0}'.format(self.line)
@@ -368,6 +799,27 @@ class Disruption(BaseObject):
 class Departure(BaseObject):
     """Information on a departing train on a certain station."""
 
+    __slots__ = (
+        'key',
+        'trip_number',
+        'departure_time_planned',
+        'departure_time',
+        'departure_status',
+        'cancelled',
+        'delay',
+        'departure_time_actual',
+        'has_delay',
+        'departure_platform',
+        'departure_platform_actual',
+        'has_platform_changed',
+        'destination',
+        'route_text',
+        'train_type',
+        'carrier',
+    )
+    _key_fields = ('key',)
+    _datetime_fields = ('departure_time_planned', 'departure_time', 'departure_time_actual')
+
     def __init__(self, departure_dict=None):
         """Construct a Departure object.
 
@@ -377,13 +829,13 @@ class Departure(BaseObject):
             return
         self.key = departure_dict['product']['number'] + '_' + departure_dict['plannedDateTime']
         self.trip_number = departure_dict['product']['number']
-        self.departure_time_planned = load_datetime(departure_dict['plannedDateTime'], NS_DATETIME)
+        self.departure_time_planned = parse_ns_datetime(departure_dict['plannedDateTime'])
         self.departure_time = self.departure_time_planned  # Default to the planned time
         self.departure_status = departure_dict['departureStatus']
         self.cancelled = departure_dict['cancelled']
         self.delay = 0
         try:
-            self.departure_time_actual = load_datetime(departure_dict['actualDateTime'], NS_DATETIME)
+            self.departure_time_actual = parse_ns_datetime(departure_dict['actualDateTime'])
             if self.departure_time_actual is not None and self.departure_time_actual != self.departure_time_planned:
                 self.has_delay = True
                 delay = self.departure_time_actual - self.departure_time_planned
@@ -407,17 +859,6 @@ class Departure(BaseObject):
         self.train_type = departure_dict['trainCategory']
         self.carrier = departure_dict['product']['operatorName']
 
-    def __getstate__(self):
-        """Get the object as a dictionary."""
-        result = super(Departure, self).__getstate__()
-        result['departure_time'] = result['departure_time'].isoformat()
-        return result
-
-    def __setstate__(self, source_dict):
-        """Restore the object from a dictionary representation."""
-        super(Departure, self).__setstate__(source_dict)
-        self.departure_time = load_datetime(source_dict['plannedDateTime'], NS_DATETIME)
-
     def __str__(self):
         """Return the string representation of this model."""
         return '<Departure> trip_number: {0} {1} {2}'.format(
@@ -428,6 +869,13 @@ class Departure(BaseObject):
 class TripRemark(BaseObject):
     """Notes on this route, generally about disruptions."""
 
+    __slots__ = (
+        'key',
+        'is_grave',
+        'message',
+    )
+    _key_fields = ('key',)
+
     def __init__(self, part_dict=None):
         """Construct a TripRemark object.
 
@@ -450,6 +898,27 @@ class TripRemark(BaseObject):
 class TripStop(BaseObject):
     """Information on a stop on a route (station, time, platform)."""
 
+    __slots__ = (
+        'name',
+        'planned_time',
+        'key',
+        'planned_key',
+        'time',
+        'actual_time',
+        'actual_key',
+        'platform_changed',
+        'planned_platform',
+        'actual_platform',
+        'delay',
+        'planned_arrival_time',
+        'actual_arrival_time',
+        'planned_arrival_platform',
+        'actual_arrival_platform',
+    )
+    _key_fields = ('name', 'planned_time')
+    _datetime_fields = ('planned_time', 'time', 'actual_time', 'planned_arrival_time', 'actual_arrival_time')
+    _timedelta_fields = ('delay',)
+
     def __init__(self, part_dict=None):
         """Construct a TripStop object.
 
@@ -464,7 +933,7 @@ class TripStop(BaseObject):
 
         if 'plannedDepartureDateTime' in part_dict:
             try:
-                self.planned_time = load_datetime(part_dict['plannedDepartureDateTime'], NS_DATETIME)
+                self.planned_time = parse_ns_datetime(part_dict['plannedDepartureDateTime'])
                 self.key = simple_time(self.planned_time) + '_' + self.name
             except TypeError:
                 self.planned_time = None
@@ -476,7 +945,7 @@ class TripStop(BaseObject):
 
         if 'actualDepartureDateTime' in part_dict:
             try:
-                self.actual_time = load_datetime(part_dict['actualDepartureDateTime'], NS_DATETIME)
+                self.actual_time = parse_ns_datetime(part_dict['actualDepartureDateTime'])
                 self.actual_key = simple_time(self.actual_time) + '_' + self.name
             except TypeError:
                 self.actual_time = None
@@ -498,17 +967,20 @@ class TripStop(BaseObject):
             self.delay = self.actual_time - self.planned_time
         else:
             self.delay = None
+        self._parse_arrival(part_dict)
 
-    def __getstate__(self):
-        """Get the object as a dictionary."""
-        result = super(TripStop, self).__getstate__()
-        result['time'] = result['time'].isoformat()
-        return result
-
-    def __setstate__(self, source_dict):
-        """Restore the object from a dictionary representation."""
-        super(TripStop, self).__setstate__(source_dict)
-        self.time = load_datetime(self.time, NS_DATETIME)
+    def _parse_arrival(self, part_dict):
+        """Parse the arrival side of the stop; the last stop of a trip only has this side."""
+        for name, field in (
+            ('planned_arrival_time', 'plannedArrivalDateTime'),
+            ('actual_arrival_time', 'actualArrivalDateTime'),
+        ):
+            try:
+                setattr(self, name, parse_ns_datetime(part_dict[field]) if field in part_dict else None)
+            except TypeError:
+                setattr(self, name, None)
+        self.planned_arrival_platform = part_dict.get('plannedArrivalTrack')
+        self.actual_arrival_platform = part_dict.get('actualArrivalTrack')
 
     def __str__(self):
         """Return the string representation of this model."""
@@ -518,10 +990,24 @@ class TripStop(BaseObject):
 class TripSubpart(BaseObject):
     """Sub route; each part means a transfer."""
 
-    def __init__(self, part_dict=None):
+    __slots__ = (
+        'trip_type',
+        'transporter',
+        'transport_type',
+        'journey_id',
+        'going',
+        'has_delay',
+        'crowd_forecast',
+        'stops',
+        '_raw_stops',
+    )
+    _key_fields = ('journey_id', 'trip_type')
+
+    def __init__(self, part_dict=None, lazy=False):
         """Construct a TripSubpart object.
 
         :param dict part_dict: TripSubpart information
+        :param bool lazy: only parse the stops when they are first accessed
         """
         if part_dict is None:
             return
@@ -543,11 +1029,20 @@ class TripSubpart(BaseObject):
         # Map crowd forecast string to enum; keep unknown strings as-is for forward compatibility
         self.crowd_forecast = parse_enum(CrowdForecast, part_dict.get('crowdForecast'))
 
-        self.stops = []
-        raw_stops = part_dict['stops']
-        for raw_stop in raw_stops:
-            stop = TripStop(raw_stop)
-            self.stops.append(stop)
+        if lazy:
+            self._raw_stops = part_dict['stops']
+        else:
+            self.stops = [TripStop(raw_stop) for raw_stop in part_dict['stops']]
+
+    def __getattr__(self, name):
+        """Parse the stops on first access, when this sub-trip was parsed lazily."""
+        raw_stops = getattr(self, '_raw_stops', None) if name == 'stops' else None
+        if raw_stops is None:
+            # Either not lazy, or another thread has just parsed the stops; raises AttributeError when not set
+            return object.__getattribute__(self, name)
+        self.stops = [TripStop(raw_stop) for raw_stop in raw_stops]
+        self._raw_stops = None
+        return self.stops
 
     @property
     def destination(self):
@@ -598,13 +1093,16 @@ class TripSubpart(BaseObject):
             return delay_found
         return self.has_delay
 
-    def __getstate__(self):
-        """Get the object as a dictionary."""
-        result = super(TripSubpart, self).__getstate__()
-        stops = []
-        for stop in self.stops:
-            stops.append(stop.to_json())
-        result['stops'] = stops
+    def __getstate__(self, nested=False):
+        """Get the object as a dictionary.
+
+        :param bool nested: include the stops as dictionaries instead of as JSON strings
+        """
+        result = super(TripSubpart, self).__getstate__(nested=nested)
+        if nested:
+            result['stops'] = [stop.__getstate__() for stop in self.stops]
+        else:
+            result['stops'] = [stop.to_json() for stop in self.stops]
         return result
 
     def __setstate__(self, source_dict):
@@ -612,12 +1110,7 @@ class TripSubpart(BaseObject):
         super(TripSubpart, self).__setstate__(source_dict)
         # Restore enum if persisted as string
         self.crowd_forecast = parse_enum(CrowdForecast, self.crowd_forecast)
-        trip_stops = []
-        for raw_stop in self.stops:
-            trip_stop = TripStop()
-            trip_stop.from_json(raw_stop)
-            trip_stops.append(trip_stop)
-        self.stops = trip_stops
+        self.stops = [TripStop.from_state(raw_stop) for raw_stop in self.stops]
 
     def __str__(self):
         """Return the string representation of this model."""
@@ -629,11 +1122,41 @@ class TripSubpart(BaseObject):
 class Trip(BaseObject):
     """Suggested route for the provided departure/destination combination."""
 
-    def __init__(self, trip_dict=None, trip_datetime=None):
+    __slots__ = (
+        'status',
+        'nr_transfers',
+        'travel_time_planned',
+        'going',
+        'travel_time_actual',
+        'requested_time',
+        'crowd_forecast',
+        'departure_time_planned',
+        'departure_time_actual',
+        'arrival_time_planned',
+        'arrival_time_actual',
+        'departure_platform_planned',
+        'departure_platform_actual',
+        'arrival_platform_planned',
+        'arrival_platform_actual',
+        'trip_parts',
+        'trip_remarks',
+        '_raw_parts',
+    )
+    _key_fields = ('departure_time_planned', 'arrival_time_planned', 'nr_transfers')
+    _datetime_fields = (
+        'requested_time',
+        'departure_time_planned',
+        'departure_time_actual',
+        'arrival_time_planned',
+        'arrival_time_actual',
+    )
+
+    def __init__(self, trip_dict=None, trip_datetime=None, lazy=False):
         """Construct a Trip object instance.
 
         :param dict trip_dict: Dictionary of trip details
         :param datetime trip_datetime: Date and time of trip
+        :param bool lazy: only parse the trip parts and their stops when they are first accessed
         """
         if trip_dict is None:
             return
@@ -654,33 +1177,29 @@ class Trip(BaseObject):
             self.going = False
         self.travel_time_actual = trip_dict['actualDurationInMinutes']
 
-        dt_format = '%Y-%m-%dT%H:%M:%S%z'
-
         self.requested_time = trip_datetime
 
         # Map crowd forecast string to enum; keep unknown strings as-is for forward compatibility
         self.crowd_forecast = parse_enum(CrowdForecast, trip_dict.get('crowdForecast'))
 
         try:
-            self.departure_time_planned = load_datetime(trip_dict['legs'][0]['origin']['plannedDateTime'], dt_format)
+            self.departure_time_planned = parse_ns_datetime(trip_dict['legs'][0]['origin']['plannedDateTime'])
         except KeyError:
             self.departure_time_planned = None
 
         try:
-            self.departure_time_actual = load_datetime(trip_dict['legs'][0]['origin']['actualDateTime'], dt_format)
+            self.departure_time_actual = parse_ns_datetime(trip_dict['legs'][0]['origin']['actualDateTime'])
         except KeyError:
             # Fall back to the planned time
             self.departure_time_actual = None
 
         try:
-            self.arrival_time_planned = load_datetime(
-                trip_dict['legs'][-1]['destination']['plannedDateTime'], dt_format
-            )
+            self.arrival_time_planned = parse_ns_datetime(trip_dict['legs'][-1]['destination']['plannedDateTime'])
         except KeyError:
             self.arrival_time_planned = None
 
         try:
-            self.arrival_time_actual = load_datetime(trip_dict['legs'][-1]['destination']['actualDateTime'], dt_format)
+            self.arrival_time_actual = parse_ns_datetime(trip_dict['legs'][-1]['destination']['actualDateTime'])
         except KeyError:
             # Fall back to the planned time
             self.arrival_time_actual = None
@@ -707,22 +1226,38 @@ class Trip(BaseObject):
             # Fall back to the planned platform
             self.arrival_platform_actual = self.arrival_platform_planned
 
-        self.trip_parts = []
         raw_parts = trip_dict['legs']
         if isinstance(trip_dict['legs'], collections.OrderedDict):
             raw_parts = [trip_dict['legs']]
-        for part in raw_parts:
-            trip_part = TripSubpart(part)
-            self.trip_parts.append(trip_part)
+        if lazy:
+            self._raw_parts = raw_parts
+        else:
+            self.trip_parts = [TripSubpart(part) for part in raw_parts]
+
+    def __getattr__(self, name):
+        """Parse the trip parts on first access, when this trip was parsed lazily."""
+        raw_parts = getattr(self, '_raw_parts', None) if name == 'trip_parts' else None
+        if raw_parts is None:
+            # Either not lazy, or another thread has just parsed the parts; raises AttributeError when not set
+            return object.__getattribute__(self, name)
+        self.trip_parts = [TripSubpart(part, lazy=True) for part in raw_parts]
+        self._raw_parts = None
+        return self.trip_parts
 
     @property
     def departure(self) -> str:
         """Return departure station name."""
+        raw_parts = getattr(self, '_raw_parts', None)
+        if raw_parts is not None:
+            return raw_parts[0]['stops'][0]['name']
         return self.trip_parts[0].stops[0].name
 
     @property
     def destination(self) -> str:
         """Return destination station name."""
+        raw_parts = getattr(self, '_raw_parts', None)
+        if raw_parts is not None:
+            return raw_parts[-1]['stops'][-1]['name']
         return self.trip_parts[-1].stops[-1].name
 
     @property
@@ -763,22 +1298,21 @@ class Trip(BaseObject):
             return True
         return False
 
-    def __getstate__(self):
-        """Get the object as a dictionary."""
-        result = super(Trip, self).__getstate__()
-        result['requested_time'] = result['requested_time'].isoformat()
-        result['departure_time_actual'] = result['departure_time_actual'].isoformat()
-        result['arrival_time_actual'] = result['arrival_time_actual'].isoformat()
-        result['departure_time_planned'] = result['departure_time_planned'].isoformat()
-        result['arrival_time_planned'] = result['arrival_time_planned'].isoformat()
-        trip_parts = []
-        for trip_part in result['trip_parts']:
-            trip_parts.append(trip_part.to_json())
-        result['trip_parts'] = trip_parts
-        trip_remarks = []
-        for trip_remark in result['trip_remarks']:
-            trip_remarks.append(trip_remark.to_json())
-        result['trip_remarks'] = trip_remarks
+    def __getstate__(self, nested=False):
+        """Get the object as a dictionary.
+
+        :param bool nested: include the trip parts (and their stops) as dictionaries instead of as JSON strings
+        """
+        result = super(Trip, self).__getstate__(nested=nested)
+        if nested:
+            result['trip_parts'] = [trip_part.__getstate__(nested=True) for trip_part in self.trip_parts]
+        else:
+            result['trip_parts'] = [trip_part.to_json() for trip_part in self.trip_parts]
+        if 'trip_remarks' in result:
+            if nested:
+                result['trip_remarks'] = [trip_remark.__getstate__() for trip_remark in self.trip_remarks]
+            else:
+                result['trip_remarks'] = [trip_remark.to_json() for trip_remark in self.trip_remarks]
         return result
 
     def __setstate__(self, source_dict):
@@ -789,20 +1323,10 @@ class Trip(BaseObject):
         self.status = parse_enum(TripStatus, self.status)
         self.crowd_forecast = parse_enum(CrowdForecast, self.crowd_forecast)
 
-        # TripSubpart deserialisation
-        trip_parts = []
-        subparts = self.trip_parts
-        for part in subparts:
-            subpart = TripSubpart()
-            subpart.from_json(part)
-            trip_parts.append(subpart)
-        self.trip_parts = trip_parts
-        # Datetime stamps
-        self.departure_time_planned = load_datetime(self.departure_time_planned, NS_DATETIME)
-        self.departure_time_actual = load_datetime(self.departure_time_actual, NS_DATETIME)
-        self.arrival_time_planned = load_datetime(self.arrival_time_planned, NS_DATETIME)
-        self.arrival_time_actual = load_datetime(self.arrival_time_actual, NS_DATETIME)
-        self.requested_time = load_datetime(self.requested_time, NS_DATETIME)
+        # Trip parts are JSON strings in the format of older versions, dictionaries in the nested format
+        self.trip_parts = [TripSubpart.from_state(part) for part in self.trip_parts]
+        if 'trip_remarks' in source_dict:
+            self.trip_remarks = [TripRemark.from_state(remark) for remark in self.trip_remarks]
 
     def delay_text(self):
         """If trip has delays, format a natural language summary."""
@@ -835,152 +1359,2374 @@ class Trip(BaseObject):
         )
 
 
-###############
-# Main library
-###############
-
+##################
+# Station helpers
+##################
 
-class NSAPI:
-    """NS API object.
 
-    Library to query the official Dutch railways API.
-    """
+class StationIndex:
+    """Index on a list of stations, to quickly resolve codes and (user provided) names to Station objects."""
 
-    def __init__(self, subscription_key):
-        """Construct the NS API library object.
+    def __init__(self, stations=None):
+        """Construct a StationIndex object.
 
-        :param str subscription_key: NS API subscription key
+        :param list stations: Station objects to index, for example from NSAPI.get_stations
         """
-        self.subscription_key = subscription_key
+        self.stations = []
+        self._by_code = {}
+        self._by_uic_code = {}
+        self._by_eva_code = {}
+        self._by_name = {}
+        self._sorted_names = []
+        for station in stations or []:
+            self._add(station)
+        self._sorted_names.sort(key=lambda item: item[0])
+
+    def _add(self, station):
+        """Add a station to the lookup tables; the first station to claim a name keeps it."""
+        self.stations.append(station)
+        self._by_code.setdefault(station.code.casefold(), station)
+        self._by_uic_code.setdefault(str(station.uic_code), station)
+        self._by_eva_code.setdefault(str(station.eva_code), station)
+        for name in (*station.names.values(), *station.synonyms):
+            if not name:
+                continue
+            folded = name.casefold()
+            if folded not in self._by_name:
+                self._by_name[folded] = station
+                self._sorted_names.append((folded, station))
 
-    def _request(self, method, url, postdata=None, params=None):
-        """Make a request to the NS API.
+    def __len__(self):
+        """Return the number of indexed stations."""
+        return len(self.stations)
 
-        :param str method: HTTP method ('GET' or 'POST')
-        :param str url: exact URL of the API endpoint
-        :param dict postdata: POST data
-        :param dict params: URL parameters
-        """
-        headers = {
-            # Request headers
-            'Ocp-Apim-Subscription-Key': self.subscription_key,
-        }
-        try:
-            conn = http.client.HTTPSConnection('gateway.apiportal.ns.nl')
-            conn.request(method, url, '{body}', headers)
-            response = conn.getresponse()
-            data = response.read().decode('UTF-8')
-            conn.close()
-            return data
-        except Exception as e:
-            print('Error during connection: {0}'.format(e))
+    def __iter__(self):
+        """Iterate over the indexed stations."""
+        return iter(self.stations)
 
-    @staticmethod
-    def parse_disruptions(data):
-        """Parse the NS API JSON result into Disruption objects.
+    def by_code(self, code):
+        """Return the station with this (case insensitive) station code, like 'ut', or None."""
+        return self._by_code.get(code.casefold())
 
-        :param str data: raw JSON result from the NS API
-        :raises:
-            - NoDataReceivedError when the NS API did not return data
-        """
-        if not data:
-            raise NoDataReceivedError('No disruptions were returned')
-        obj = json.loads(data)
-        disruptions = {'unplanned': [], 'planned': []}
-        if obj['payload']:
-            raw_disruptions = obj['payload']
-            if isinstance(raw_disruptions, collections.OrderedDict):
-                raw_disruptions = [raw_disruptions]
-            for disruption in raw_disruptions:
-                if disruption['type'] == 'storing' or disruption['type'] == 'verstoring':
-                    new_disruption = Disruption(disruption)
-                    disruptions['unplanned'].append(new_disruption)
-                elif disruption['type'] == 'werkzaamheid':
-                    new_disruption = Disruption(disruption)
-                    disruptions['planned'].append(new_disruption)
-        return disruptions
+    def by_uic_code(self, uic_code):
+        """Return the station with this UIC code, or None."""
+        return self._by_uic_code.get(str(uic_code))
 
-    def get_disruptions(self, station=None, actual=True, unplanned=True):
-        """Fetch the current disruptions, or even the planned ones.
+    def by_eva_code(self, eva_code):
+        """Return the station with this EVA code, or None."""
+        return self._by_eva_code.get(str(eva_code))
 
-        :param str station: station to lookup
-        :param bool actual: only actual disruptions
-        :param bool unplanned: only unplanned disruptions
-        """
-        params = urllib.parse.urlencode(
-            {
-                # Request parameters
-                'actual': actual,
-                'lang': 'nl',
-            }
-        )
-        if station is None:
-            url = '/reisinformatie-api/api/v2/disruptions?%s' % params
-        else:
-            url = '/reisinformatie-api/api/v2/disruptions/station/%s?%s' % (
-                station,
-                params,
-            )
-        raw_disruptions = self._request('GET', url)
-        return self.parse_disruptions(raw_disruptions)
+    def by_name(self, name):
+        """Return the station with this (case insensitive) short, middle or long name or synonym, or None."""
+        return self._by_name.get(name.casefold())
 
-    @staticmethod
-    def parse_departures(data):
-        """Parse the NS API JSON result into Departure objects.
+    def lookup(self, value):
+        """Resolve a station code, UIC code, EVA code or name to its station.
 
-        :param str data: raw JSON result from the NS API
-        :raises:
-            - NoDataReceivedError when the NS API did not return data
+        :param str value: user provided station identification
+        :return: the matching station, or None
+        :rtype: Station
         """
-        if not data:
-            raise NoDataReceivedError('No departures were returned')
-        obj = json.loads(data)
-        departures = []
+        value = str(value).strip()
+        for lookup in (self.by_code, self.by_name, self.by_uic_code, self.by_eva_code):
+            station = lookup(value)
+            if station is not None:
+                return station
+        return None
 
-        for departure in obj['payload']['departures']:
-            new_departure = Departure(departure)
-            departures.append(new_departure)
+    def search(self, prefix, limit=10):
+        """Find the stations of which a name or synonym starts with prefix, for autocompletion.
 
-        return departures
+        :param str prefix: (case insensitive) start of the name
+        :param int limit: maximum number of stations to return
+        :return: matching stations, ordered by the matching name
+        :rtype: list
+        """
+        prefix = prefix.strip().casefold()
+        result = []
+        seen = set()
+        position = bisect.bisect_left(self._sorted_names, prefix, key=lambda item: item[0])
+        for folded, station in itertools.islice(self._sorted_names, position, None):
+            if len(result) >= limit or not folded.startswith(prefix):
+                break
+            if id(station) not in seen:
+                seen.add(id(station))
+                result.append(station)
+        return result
 
-    def get_departures(
-        self,
-        station=None,
-        for_datetime=None,
-        max_journeys='25',
-        uic_code=None,
-        source=None,
-    ):
-        """Fetch the current departure times from this station.
 
-        :param str station: station to lookup
-        :param str for_datetime: Format - date-time (as date-time in RFC3339)
-        :param str max_journeys: int32. number of departures or arrivals to return
-        :param str uic_code: specify a station by UIC code (84xxxxx)
-        :param str source: forces to use a certain source
-        """
-        params = urllib.parse.urlencode(
-            {
-                # Request parameters
-                'dateTime': for_datetime,
-                'maxJourneys': max_journeys,
-                'lang': 'nl',
-                'station': station,
-                'uicCode': uic_code,
-                'source': source,
-            }
-        )
-        url = '/reisinformatie-api/api/v2/departures?%s' % params
+# Mean radius of the earth, for distances between coordinates
+EARTH_RADIUS_KM = 6371.0088
 
-        raw_departures = self._request('GET', url)
-        return self.parse_departures(raw_departures)
 
-    @staticmethod
-    def parse_trips(data, requested_time):
-        """Parse the NS API JSON result into Trip objects.
+def haversine(lat_a, lon_a, lat_b, lon_b):
+    """Calculate the great-circle distance between two coordinates.
+
+    :param float lat_a: latitude of the first coordinate, in degrees
+    :param float lon_a: longitude of the first coordinate, in degrees
+    :param float lat_b: latitude of the second coordinate, in degrees
+    :param float lon_b: longitude of the second coordinate, in degrees
+    :return: distance in kilometres
+    :rtype: float
+    """
+    lat_a, lon_a, lat_b, lon_b = map(math.radians, (lat_a, lon_a, lat_b, lon_b))
+    h = math.sin((lat_b - lat_a) / 2) ** 2 + math.cos(lat_a) * math.cos(lat_b) * math.sin((lon_b - lon_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+class StationGrid:
+    """Spatial index on the coordinates of stations, for nearest-station and within-radius queries.
+
+    Stations are bucketed in a grid of cell_size by cell_size degrees, so a query only needs to look at the cells
+    around the requested coordinate instead of at every station.
+    """
+
+    def __init__(self, stations, cell_size=0.1):
+        """Construct a StationGrid object.
+
+        :param list stations: Station objects to index; stations without coordinates are skipped
+        :param float cell_size: size of a grid cell, in degrees
+        """
+        self.cell_size = cell_size
+        self.stations = [station for station in stations if station.lat is not None and station.lon is not None]
+        self._cells = collections.defaultdict(list)
+        for station in self.stations:
+            self._cells[self._cell(station.lat, station.lon)].append(station)
+        if self._cells:
+            rows = [cell[0] for cell in self._cells]
+            columns = [cell[1] for cell in self._cells]
+            self._bounds = (min(rows), max(rows), min(columns), max(columns))
+            max_lat = max(abs(station.lat) for station in self.stations)
+        else:
+            self._bounds = (0, 0, 0, 0)
+            max_lat = 0
+        # Shortest distance one degree can span within the indexed area (a degree of longitude at the highest latitude)
+        self._km_per_degree = math.radians(EARTH_RADIUS_KM) * math.cos(math.radians(min(max_lat + cell_size, 89.0)))
+
+    def __len__(self):
+        """Return the number of indexed stations."""
+        return len(self.stations)
+
+    def _cell(self, lat, lon):
+        """Return the grid cell of a coordinate."""
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def _ring(self, row, column, radius):
+        """Yield the stations in the cells at exactly radius cells from (row, column)."""
+        if radius == 0:
+            yield from self._cells.get((row, column), ())
+            return
+        for offset in range(-radius, radius + 1):
+            for cell in (
+                (row - radius, column + offset),
+                (row + radius, column + offset),
+            ):
+                yield from self._cells.get(cell, ())
+        for offset in range(-radius + 1, radius):
+            for cell in (
+                (row + offset, column - radius),
+                (row + offset, column + radius),
+            ):
+                yield from self._cells.get(cell, ())
+
+    def nearest(self, lat, lon, k=1):
+        """Find the k stations closest to a coordinate.
+
+        :param float lat: latitude, in degrees
+        :param float lon: longitude, in degrees
+        :param int k: number of stations to return
+        :return: (distance in km, station) tuples, closest first
+        :rtype: list
+        """
+        if not self.stations or k < 1:
+            return []
+        row, column = self._cell(lat, lon)
+        min_row, max_row, min_column, max_column = self._bounds
+        max_radius = max(abs(row - min_row), abs(row - max_row), abs(column - min_column), abs(column - max_column))
+        found = []
+        for radius in range(max_radius + 1):
+            for station in self._ring(row, column, radius):
+                found.append((haversine(lat, lon, station.lat, station.lon), station))
+            if len(found) >= k:
+                found.sort(key=lambda item: item[0])
+                del found[k:]
+                # Stations in cells further out are at least this far away
+                if found[-1][0] <= radius * self.cell_size * self._km_per_degree:
+                    break
+        found.sort(key=lambda item: item[0])
+        return found[:k]
+
+    def within(self, lat, lon, radius_km):
+        """Find the stations within a distance of a coordinate.
+
+        :param float lat: latitude, in degrees
+        :param float lon: longitude, in degrees
+        :param float radius_km: maximum distance, in kilometres
+        :return: (distance in km, station) tuples, closest first
+        :rtype: list
+        """
+        if not self.stations:
+            return []
+        row, column = self._cell(lat, lon)
+        cells = math.ceil(radius_km / (self.cell_size * self._km_per_degree)) if self._km_per_degree else 0
+        found = []
+        for cell_row in range(row - cells, row + cells + 1):
+            for cell_column in range(column - cells, column + cells + 1):
+                for station in self._cells.get((cell_row, cell_column), ()):
+                    distance = haversine(lat, lon, station.lat, station.lon)
+                    if distance <= radius_km:
+                        found.append((distance, station))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest_many(self, coordinates, k=1, chunk_size=1024):
+        """Find the k stations closest to each of many coordinates at once, vectorised with NumPy.
+
+        :param list coordinates: (lat, lon) pairs, or an array of shape (n, 2)
+        :param int k: number of stations to return per coordinate
+        :param int chunk_size: number of coordinates to compare with all stations in one go, bounding memory use
+        :return: per coordinate, a list of (distance in km, station) tuples, closest first
+        :rtype: list
+        :raises:
+            - ImportError when NumPy is not installed
+        """
+        import numpy as np
+
+        points = np.radians(np.asarray(coordinates, dtype=float).reshape(-1, 2))
+        if not self.stations or k < 1:
+            return [[] for _ in range(len(points))]
+        k = min(k, len(self.stations))
+        station_lat = np.radians(np.array([station.lat for station in self.stations], dtype=float))
+        station_lon = np.radians(np.array([station.lon for station in self.stations], dtype=float))
+        cos_station_lat = np.cos(station_lat)
+
+        result = []
+        for start in range(0, len(points), chunk_size):
+            lat = points[start : start + chunk_size, 0:1]
+            lon = points[start : start + chunk_size, 1:2]
+            h = (
+                np.sin((station_lat - lat) / 2) ** 2
+                + np.cos(lat) * cos_station_lat * np.sin((station_lon - lon) / 2) ** 2
+            )
+            distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+            if k < len(self.stations):
+                candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.broadcast_to(np.arange(k), (len(distances), k))
+            candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+            order = np.argsort(candidate_distances, axis=1)
+            candidates = np.take_along_axis(candidates, order, axis=1)
+            candidate_distances = np.take_along_axis(candidate_distances, order, axis=1)
+            for indices, row_distances in zip(candidates.tolist(), candidate_distances.tolist()):
+                result.append([(distance, self.stations[index]) for distance, index in zip(row_distances, indices)])
+        return result
+
+
+# Format version of station snapshot files; files with another version are ignored and written anew
+STATION_SNAPSHOT_VERSION = 1
+
+_STATION_SNAPSHOT_HEADER = struct.Struct('<8sHd')
+_STATION_SNAPSHOT_MAGIC = b'NSAPISTN'
+
+
+class StationSnapshot:
+    """Station list kept in a file on disk, so a new process has the stations at hand without calling the API.
+
+    The file holds a small header (format version and the time of saving) followed by the stations serialised with
+    list_to_bytes. A snapshot older than max_age is still used, but refreshed from the API in a background thread.
+    """
+
+    def __init__(self, path, max_age=86400):
+        """Construct a StationSnapshot object.
+
+        :param str path: path of the snapshot file
+        :param float max_age: seconds after which the snapshot is refreshed
+        """
+        self.path = path
+        self.max_age = max_age
+        self.stations = None
+        self.saved_at = None
+        self._lock = threading.Lock()
+        self._refreshing = None
+
+    def load(self):
+        """Read the snapshot file.
+
+        :return: the stations and the time they were saved at, or None and None when there is no usable snapshot
+        :rtype: tuple
+        """
+        import pickle
+
+        try:
+            with open(self.path, 'rb') as snapshot_file:
+                data = snapshot_file.read()
+            magic, version, saved_at = _STATION_SNAPSHOT_HEADER.unpack_from(data)
+            if magic != _STATION_SNAPSHOT_MAGIC or version != STATION_SNAPSHOT_VERSION:
+                return None, None
+            return list_from_bytes(data[_STATION_SNAPSHOT_HEADER.size :]), saved_at
+        except (OSError, struct.error, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+            return None, None
+
+    def save(self, stations, saved_at=None):
+        """Write the stations to the snapshot file, replacing it atomically.
+
+        :param list stations: Station objects
+        :param float saved_at: time of the stations in seconds since the epoch; defaults to now
+        :raises:
+            - OSError when the file can not be written; the existing snapshot file is left as it was
+        """
+        if saved_at is None:
+            saved_at = time.time()
+        header = _STATION_SNAPSHOT_HEADER.pack(_STATION_SNAPSHOT_MAGIC, STATION_SNAPSHOT_VERSION, saved_at)
+        temporary_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        try:
+            with open(temporary_path, 'wb') as snapshot_file:
+                snapshot_file.write(header + list_to_bytes(stations))
+            os.replace(temporary_path, self.path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(temporary_path)
+            raise
+        self.stations = stations
+        self.saved_at = saved_at
+
+    def is_stale(self):
+        """Return whether the snapshot is missing or older than max_age."""
+        return self.saved_at is None or time.time() - self.saved_at > self.max_age
+
+    def refresh(self, fetch):
+        """Fetch the stations and save them.
+
+        When the snapshot file can not be written, the stations are still kept in memory and returned.
+
+        :param callable fetch: function returning the current list of stations, like NSAPI.get_stations
+        :return: the fetched stations
+        :rtype: list
+        """
+        stations = fetch()
+        try:
+            self.save(stations)
+        except OSError as e:
+            print('Error while saving the station snapshot: {0}'.format(e))
+            self.stations = stations
+            self.saved_at = time.time()
+        return stations
+
+    def _refresh_in_background(self, fetch):
+        """Refresh the snapshot, keeping the current one when that fails."""
+        try:
+            self.refresh(fetch)
+        except Exception as e:
+            print('Error while refreshing the station snapshot: {0}'.format(e))
+
+    def get(self, fetch):
+        """Return the stations, loading the snapshot file first and only falling back to fetch when there is none.
+
+        A stale snapshot is returned right away, while a background thread fetches and saves the current stations.
+
+        :param callable fetch: function returning the current list of stations, like NSAPI.get_stations
+        :return: list of the stations
+        :rtype: list
+        """
+        with self._lock:
+            if self.stations is None:
+                self.stations, self.saved_at = self.load()
+            if self.stations is None:
+                return self.refresh(fetch)
+            if self.is_stale() and (self._refreshing is None or not self._refreshing.is_alive()):
+                self._refreshing = threading.Thread(target=self._refresh_in_background, args=(fetch,), daemon=True)
+                self._refreshing.start()
+            return self.stations
+
+
+##################
+# Offline routing
+##################
+
+
+# Trains running after midnight still belong to the day of service they started on
+SERVICE_DAY_OFFSET = timedelta(hours=4)
+# A stop of a train number this close to the known stops of that train on the neighbouring day of service belongs to
+# the same journey, so a train running across SERVICE_DAY_OFFSET is not split in two
+JOURNEY_WINDOW = timedelta(hours=12)
+
+
+class LocalRouter:
+    """Plans trips offline with the Connection Scan Algorithm, over collected trip parts and departure boards.
+
+    Each journey (a train number on a day of service) is assembled from the stops of trip parts and from the
+    departures of that train on the boards of the stations it calls at. Each connection runs from the departure at one
+    stop to the arrival at the next, and connections get scanned in order of departure; actual times are used where
+    known. A stop the train only arrives at, like the end of the line, can be alighted at but not boarded.
+    """
+
+    def __init__(self, stations=None, transfer_time=120):
+        """Construct a LocalRouter object.
+
+        :param list stations: optional Station objects (or a StationIndex), to accept station codes and other names
+        :param int transfer_time: minimum number of seconds needed to change trains at a station
+        """
+        if stations is not None and not isinstance(stations, StationIndex):
+            stations = StationIndex(stations)
+        self.stations = stations
+        self.transfer_time = transfer_time
+        self._journeys = {}
+        self._names = {}
+        self._station_ids = {}
+        self._connections = None
+        self._departure_times = None
+        self._journey_stops = None
+
+    def _station_name(self, station):
+        """Resolve a Station, station code or name to the name the router uses for it."""
+        if isinstance(station, Station):
+            return station.names['long']
+        name = self._names.get(station)
+        if name is None:
+            found = self.stations.lookup(station) if self.stations is not None else None
+            name = found.names['long'] if found is not None else station
+            self._names[station] = name
+        return name
+
+    @staticmethod
+    def _planned(stop):
+        """Return the planned time of a stop: its departure, or its arrival for a stop the train only arrives at."""
+        planned_time = getattr(stop, 'planned_time', None)
+        return planned_time if planned_time is not None else getattr(stop, 'planned_arrival_time', None)
+
+    @staticmethod
+    def _departs(stop):
+        """Return when the train leaves a stop, or None when it does not leave from there."""
+        return getattr(stop, 'actual_time', None) or getattr(stop, 'planned_time', None)
+
+    @staticmethod
+    def _arrives(stop):
+        """Return when the train arrives at a stop, falling back to its departure when only that is known."""
+        return (
+            getattr(stop, 'actual_arrival_time', None)
+            or getattr(stop, 'planned_arrival_time', None)
+            or LocalRouter._departs(stop)
+        )
+
+    @staticmethod
+    def _add_stop(journey_stops, name, stop):
+        """Add a stop to a journey, keeping the times of the stop already known at that station that this one lacks."""
+        previous = journey_stops.get(name)
+        if previous is not None and previous is not stop:
+            state = previous._state()
+            state.update((key, value) for key, value in stop._state().items() if value is not None)
+            stop = TripStop.from_state(state)
+        journey_stops[name] = stop
+
+    def _journey(self, number, planned_time, carrier, train_type, last_time=None):
+        """Return the stops by station name of the journey of this train, creating it when needed.
+
+        The journey is found on the day of service of planned_time, or on a neighbouring day when its known stops are
+        within JOURNEY_WINDOW; last_time is the planned time of the last of the stops being added, if more than one.
+        """
+        last_time = last_time or planned_time
+        day = (planned_time - SERVICE_DAY_OFFSET).date()
+        journey = self._journeys.get((str(number), day))
+        if journey is None:
+            for neighbour in (day - timedelta(days=1), day + timedelta(days=1)):
+                candidate = self._journeys.get((str(number), neighbour))
+                if (
+                    candidate is not None
+                    and candidate['first'] - JOURNEY_WINDOW <= last_time
+                    and planned_time <= candidate['last'] + JOURNEY_WINDOW
+                ):
+                    journey = candidate
+                    break
+            else:
+                journey = self._journeys[(str(number), day)] = {
+                    'journey_id': number,
+                    'transporter': carrier,
+                    'transport_type': train_type,
+                    'stops': {},
+                    'first': planned_time,
+                    'last': last_time,
+                }
+        journey['first'] = min(journey['first'], planned_time)
+        journey['last'] = max(journey['last'], last_time)
+        self._connections = None
+        return journey['stops']
+
+    def add_trip_part(self, part):
+        """Add the stops of a TripSubpart; cancelled parts and parts without a train (like walks) are skipped.
+
+        :param TripSubpart part: part of a trip, for example from NSAPI.get_trips
+        """
+        if not part.going or not part.journey_id:
+            return
+        stops = [stop for stop in part.stops if self._planned(stop) is not None]
+        if not stops:
+            return
+        journey_stops = self._journey(
+            part.journey_id, self._planned(stops[0]), part.transporter, part.transport_type, self._planned(stops[-1])
+        )
+        for stop in stops:
+            self._add_stop(journey_stops, self._station_name(stop.name), stop)
+
+    def add_trips(self, trips):
+        """Add the stops of all parts of these trips.
+
+        :param list trips: Trip objects, for example from NSAPI.get_trips
+        """
+        for trip in trips:
+            for part in trip.trip_parts:
+                self.add_trip_part(part)
+
+    def add_departures(self, station, departures):
+        """Add the departures on the departure board of a station; cancelled departures are skipped.
+
+        :param str station: the station of the departure board: a Station, station code or name
+        :param list departures: Departure objects, for example from NSAPI.get_departures
+        """
+        name = self._station_name(station)
+        for departure in departures:
+            if departure.cancelled:
+                continue
+            stop = TripStop()
+            stop.name = name
+            stop.planned_time = departure.departure_time_planned
+            stop.time = stop.planned_time
+            stop.key = simple_time(stop.planned_time) + '_' + name
+            stop.actual_time = getattr(departure, 'departure_time_actual', None)
+            stop.actual_key = None if stop.actual_time is None else simple_time(stop.actual_time) + '_' + name
+            stop.delay = None if stop.actual_time is None else stop.actual_time - stop.planned_time
+            stop.planned_platform = departure.departure_platform
+            stop.actual_platform = getattr(departure, 'departure_platform_actual', stop.planned_platform)
+            stop.platform_changed = stop.actual_platform != stop.planned_platform
+            journey_stops = self._journey(
+                departure.trip_number, stop.planned_time, departure.carrier, departure.train_type
+            )
+            self._add_stop(journey_stops, name, stop)
+
+    def _station_id(self, name):
+        """Return the number of a station in the arrays of the scan."""
+        return self._station_ids.setdefault(name, len(self._station_ids))
+
+    def _build(self):
+        """Build the list of connections, sorted on departure time."""
+        connections = []
+        self._journey_stops = []
+        for number, journey in enumerate(self._journeys.values()):
+            items = sorted(journey['stops'].items(), key=lambda item: self._planned(item[1]))
+            stops = [stop for _, stop in items]
+            self._journey_stops.append((journey, stops))
+            stations = [self._station_id(name) for name, _ in items]
+            departs = [self._departs(stop) for stop in stops]
+            arrives = [self._arrives(stop).timestamp() for stop in stops]
+            for position in range(len(stops) - 1):
+                if departs[position] is None:
+                    continue
+                departure_time = departs[position].timestamp()
+                if arrives[position + 1] >= departure_time:
+                    connections.append(
+                        (
+                            departure_time,
+                            arrives[position + 1],
+                            stations[position],
+                            stations[position + 1],
+                            number,
+                            position,
+                        )
+                    )
+        connections.sort()
+        self._connections = connections
+        self._departure_times = [connection[0] for connection in connections]
+
+    def _scan(self, origin, departure_time, target=None):
+        """Run the connection scan from origin, stopping early once target can not be reached any sooner.
+
+        :return: earliest arrival per station number, and per reached station the connections used to get there
+        """
+        if self._connections is None:
+            self._build()
+        origin = self._station_ids.get(self._station_name(origin))
+        if origin is None:
+            return None, None, None
+        start = departure_time.timestamp()
+        transfer_time = self.transfer_time
+        arrival = [math.inf] * len(self._station_ids)
+        # No time is needed to change trains at the station the trip starts at
+        arrival[origin] = start - transfer_time
+        boarded = {}
+        via = {}
+        connections = self._connections
+        for position in range(bisect.bisect_left(self._departure_times, start), len(connections)):
+            departs, arrives, from_station, to_station, journey, _ = connections[position]
+            if target is not None and departs >= arrival[target]:
+                break
+            if journey in boarded or arrival[from_station] + transfer_time <= departs:
+                boarding = boarded.setdefault(journey, position)
+                if arrives < arrival[to_station]:
+                    arrival[to_station] = arrives
+                    via[to_station] = (boarding, position)
+        return origin, arrival, via
+
+    def _trip(self, origin, target, via, requested_time):
+        """Build a Trip from the connections that lead from origin to target."""
+        legs = []
+        station = target
+        while station != origin:
+            boarding, alighting = via[station]
+            _, _, station, _, journey, first = self._connections[boarding]
+            legs.append((journey, first, self._connections[alighting][5] + 1))
+        legs.reverse()
+
+        trip = Trip()
+        trip.trip_parts = []
+        for journey, first, last in legs:
+            journey, stops = self._journey_stops[journey]
+            part = TripSubpart()
+            part.trip_type = 'PUBLIC_TRANSIT'
+            part.transporter = journey['transporter']
+            part.transport_type = journey['transport_type']
+            part.journey_id = journey['journey_id']
+            part.going = True
+            part.crowd_forecast = None
+            part.stops = stops[first : last + 1]
+            part.has_delay = any(
+                stop.actual_time not in (None, stop.planned_time)
+                or getattr(stop, 'actual_arrival_time', None) not in (None, getattr(stop, 'planned_arrival_time', None))
+                for stop in part.stops
+            )
+            trip.trip_parts.append(part)
+
+        first_stop = trip.trip_parts[0].stops[0]
+        last_stop = trip.trip_parts[-1].stops[-1]
+        trip.status = TripStatus.NORMAL
+        trip.nr_transfers = len(trip.trip_parts) - 1
+        trip.going = True
+        trip.requested_time = requested_time
+        trip.crowd_forecast = None
+        trip.departure_time_planned = first_stop.planned_time
+        trip.departure_time_actual = first_stop.actual_time
+        trip.arrival_time_planned = getattr(last_stop, 'planned_arrival_time', None) or last_stop.planned_time
+        trip.arrival_time_actual = getattr(last_stop, 'actual_arrival_time', None) or last_stop.actual_time
+        trip.travel_time_planned = int((trip.arrival_time_planned - first_stop.planned_time).total_seconds() // 60)
+        trip.travel_time_actual = int((self._arrives(last_stop) - self._departs(first_stop)).total_seconds() // 60)
+        trip.departure_platform_planned = first_stop.planned_platform
+        trip.departure_platform_actual = getattr(first_stop, 'actual_platform', first_stop.planned_platform)
+        trip.arrival_platform_planned = (
+            getattr(last_stop, 'planned_arrival_platform', None) or last_stop.planned_platform
+        )
+        trip.arrival_platform_actual = (
+            getattr(last_stop, 'actual_arrival_platform', None)
+            or getattr(last_stop, 'actual_platform', None)
+            or trip.arrival_platform_planned
+        )
+        return trip
+
+    def plan(self, departure, destination, departure_time):
+        """Find the trip that arrives at destination the earliest, leaving departure at or after departure_time.
+
+        :param str departure: departure station: a Station, station code or name
+        :param str destination: destination station: a Station, station code or name
+        :param datetime departure_time: timezone aware date and time to leave at the earliest
+        :return: the trip, in the same form as the trips of NSAPI.get_trips, or None when no trip was found
+        :rtype: Trip
+        """
+        if self._connections is None:
+            self._build()
+        target = self._station_ids.get(self._station_name(destination))
+        if target is None:
+            return None
+        origin, _arrival, via = self._scan(departure, departure_time, target)
+        # The departure station itself is never in via, so a trip to it is not found either
+        if origin is None or target not in via:
+            return None
+        return self._trip(origin, target, via, departure_time)
+
+    def earliest_arrivals(self, departure, departure_time):
+        """Find the earliest arrival time at every station that can be reached from departure, in one scan.
+
+        :param str departure: departure station: a Station, station code or name
+        :param datetime departure_time: timezone aware date and time to leave at the earliest
+        :return: earliest arrival time by station name
+        :rtype: dict
+        """
+        _origin, _arrival, via = self._scan(departure, departure_time)
+        if via is None:
+            return {}
+        names = list(self._station_ids)
+        result = {}
+        for station, (_, alighting) in via.items():
+            _, _, _, _, journey, position = self._connections[alighting]
+            stop = self._journey_stops[journey][1][position + 1]
+            result[names[station]] = self._arrives(stop)
+        return result
+
+
+##################
+# Columnar export
+##################
+
+
+# Columns of the arrays created by the *_to_columns functions, with their NumPy dtype. Times are seconds since the
+# epoch (UTC); the actual time equals the planned time when no actual time is known. Departure boards know the code
+# of their station and trip stops the name; the other one is None unless a station list was given to look it up in.
+COLUMNS = (
+    ('station_code', object),
+    ('station_name', object),
+    ('trip_number', object),
+    ('planned_time', 'int64'),
+    ('actual_time', 'int64'),
+    ('delay', 'int64'),
+    ('platform', object),
+    ('platform_actual', object),
+    ('platform_changed', bool),
+    ('cancelled', bool),
+    ('train_type', object),
+    ('carrier', object),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _offset_seconds(offset):
+    """Return the number of seconds of a timezone offset such as +0200 or +02:00."""
+    offset = offset.replace(':', '')
+    seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    return -seconds if offset[0] == '-' else seconds
+
+
+def _epoch_seconds(timestamps):
+    """Convert NS API timestamps (in NS_DATETIME format) to seconds since the epoch, vectorised with NumPy.
+
+    :param list timestamps: timestamps like 2024-01-31T12:34:00+0100
+    :rtype: numpy.ndarray
+    """
+    import numpy as np
+
+    local = np.array([timestamp[:19] for timestamp in timestamps], dtype='datetime64[s]').astype('int64')
+    offsets = np.fromiter((_offset_seconds(timestamp[19:]) for timestamp in timestamps), 'int64', len(timestamps))
+    return local - offsets
+
+
+def _rows_to_columns(rows):
+    """Turn rows with the fields of COLUMNS into a dictionary of NumPy arrays, one per column."""
+    import numpy as np
+
+    columns = list(zip(*rows)) or [()] * len(COLUMNS)
+    return {name: np.array(values, dtype=dtype) for (name, dtype), values in zip(COLUMNS, columns)}
+
+
+def _station_identifiers(stations, code=None, name=None):
+    """Return the code and long name of a station, completing the one that is not given from stations when possible.
+
+    :param StationIndex stations: stations to look up the station in, or None
+    :param str code: station code, or a Station
+    :param str name: station name
+    :rtype: tuple
+    """
+    if isinstance(code, Station):
+        return code.code, code.names['long']
+    found = stations.lookup(code if code is not None else name) if stations is not None else None
+    if found is not None:
+        return found.code, found.names['long']
+    return code, name
+
+
+def _station_index(stations):
+    """Return stations as StationIndex; None stays None."""
+    if stations is not None and not isinstance(stations, StationIndex):
+        stations = StationIndex(stations)
+    return stations
+
+
+def departures_to_columns(departures, station=None, stations=None):
+    """Convert Departure objects to columns, for vectorised analysis with NumPy or pandas.
+
+    :param list departures: Departure objects, like from NSAPI.get_departures
+    :param str station: the station the departures are from, as Station or station code
+    :param list stations: optional Station objects (or a StationIndex), to fill in the name of a station code
+    :return: NumPy array per column; see COLUMNS
+    :rtype: dict
+    :raises:
+        - ImportError when NumPy is not installed
+    """
+    station_code, station_name = _station_identifiers(_station_index(stations), station)
+    rows = []
+    for departure in departures:
+        planned_time = int(departure.departure_time_planned.timestamp())
+        actual_time = getattr(departure, 'departure_time_actual', None)
+        actual_time = planned_time if actual_time is None else int(actual_time.timestamp())
+        platform_actual = getattr(departure, 'departure_platform_actual', departure.departure_platform)
+        rows.append(
+            (
+                station_code,
+                station_name,
+                departure.trip_number,
+                planned_time,
+                actual_time,
+                actual_time - planned_time,
+                departure.departure_platform,
+                platform_actual,
+                platform_actual != departure.departure_platform,
+                departure.cancelled,
+                departure.train_type,
+                departure.carrier,
+            )
+        )
+    return _rows_to_columns(rows)
+
+
+def departures_response_to_columns(data, station=None, stations=None):
+    """Convert a raw departures response of the NS API to columns, without creating Departure objects.
+
+    :param str data: raw JSON result from the NS API
+    :param str station: the station the departures are from, as Station or station code
+    :param list stations: optional Station objects (or a StationIndex), to fill in the name of a station code
+    :return: NumPy array per column; see COLUMNS
+    :rtype: dict
+    :raises:
+        - NoDataReceivedError when the NS API did not return data
+        - ImportError when NumPy is not installed
+    """
+    if not data:
+        raise NoDataReceivedError('No departures were returned')
+    raw_departures = json.loads(data)['payload']['departures']
+    station_code, station_name = _station_identifiers(_station_index(stations), station)
+    rows = []
+    planned_times = []
+    actual_times = []
+    for departure in raw_departures:
+        planned_times.append(departure['plannedDateTime'])
+        actual_times.append(departure.get('actualDateTime') or departure['plannedDateTime'])
+        platform = departure['plannedTrack']
+        platform_actual = departure.get('actualTrack', platform)
+        rows.append(
+            (
+                station_code,
+                station_name,
+                departure['product']['number'],
+                0,
+                0,
+                0,
+                platform,
+                platform_actual,
+                platform_actual != platform,
+                departure['cancelled'],
+                departure['trainCategory'],
+                departure['product']['operatorName'],
+            )
+        )
+    columns = _rows_to_columns(rows)
+    if rows:
+        columns['planned_time'] = _epoch_seconds(planned_times)
+        columns['actual_time'] = _epoch_seconds(actual_times)
+        columns['delay'] = columns['actual_time'] - columns['planned_time']
+    return columns
+
+
+def trip_stops_to_columns(trips, stations=None):
+    """Convert the stops of all parts of Trip objects to columns, for vectorised analysis with NumPy or pandas.
+
+    Stops the train passes without stopping, and stops without a departure time, are left out.
+
+    :param list trips: Trip objects, like from NSAPI.get_trips
+    :param list stations: optional Station objects (or a StationIndex), to fill in the code of a station name
+    :return: NumPy array per column; see COLUMNS
+    :rtype: dict
+    :raises:
+        - ImportError when NumPy is not installed
+    """
+    stations = _station_index(stations)
+    identifiers = {}
+    rows = []
+    for trip in trips:
+        for part in trip.trip_parts:
+            for stop in part.stops:
+                if getattr(stop, 'planned_time', None) is None:
+                    continue
+                planned_time = int(stop.planned_time.timestamp())
+                actual_time = planned_time if stop.actual_time is None else int(stop.actual_time.timestamp())
+                platform_actual = getattr(stop, 'actual_platform', stop.planned_platform)
+                if stop.name not in identifiers:
+                    identifiers[stop.name] = _station_identifiers(stations, name=stop.name)
+                rows.append(
+                    (
+                        *identifiers[stop.name],
+                        part.journey_id,
+                        planned_time,
+                        actual_time,
+                        actual_time - planned_time,
+                        stop.planned_platform,
+                        platform_actual,
+                        stop.platform_changed,
+                        not part.going,
+                        part.transport_type,
+                        part.transporter,
+                    )
+                )
+    return _rows_to_columns(rows)
+
+
+def trips_response_to_columns(data, stations=None):
+    """Convert the stops in a raw trips response of the NS API to columns, without creating Trip objects.
+
+    :param str data: 'raw' response from API
+    :param list stations: optional Station objects (or a StationIndex), to fill in the code of a station name
+    :return: NumPy array per column; see COLUMNS and trip_stops_to_columns
+    :rtype: dict
+    :raises:
+        - NoDataReceivedError when the NS API did not return data
+        - ImportError when NumPy is not installed
+    """
+    if not data:
+        raise NoDataReceivedError('No trips were returned')
+    stations = _station_index(stations)
+    identifiers = {}
+    rows = []
+    planned_times = []
+    actual_times = []
+    for trip in json.loads(data).get('trips') or []:
+        for leg in trip['legs']:
+            product = leg.get('product', {})
+            for stop in leg['stops']:
+                if stop.get('passing') or not stop.get('plannedDepartureDateTime'):
+                    continue
+                planned_times.append(stop['plannedDepartureDateTime'])
+                actual_times.append(stop.get('actualDepartureDateTime') or stop['plannedDepartureDateTime'])
+                platform = stop.get('plannedDepartureTrack')
+                platform_actual = stop.get('actualDepartureTrack', platform)
+                if stop['name'] not in identifiers:
+                    identifiers[stop['name']] = _station_identifiers(stations, name=stop['name'])
+                rows.append(
+                    (
+                        *identifiers[stop['name']],
+                        product.get('number', 0),
+                        0,
+                        0,
+                        0,
+                        platform,
+                        platform_actual,
+                        platform_actual != platform,
+                        leg['cancelled'],
+                        product.get('categoryCode', '-'),
+                        product.get('operatorName', '-'),
+                    )
+                )
+    columns = _rows_to_columns(rows)
+    if rows:
+        columns['planned_time'] = _epoch_seconds(planned_times)
+        columns['actual_time'] = _epoch_seconds(actual_times)
+        columns['delay'] = columns['actual_time'] - columns['planned_time']
+    return columns
+
+
+class DelayStats:
+    """Delay statistics over large numbers of departures or trip stops, computed vectorised with NumPy.
+
+    The statistics per group are the number of rows ('count'), the 'mean_delay', 'median_delay' and 'p95_delay' in
+    seconds over the trains that were not cancelled (NaN when there are none), and the 'cancellation_rate' and
+    'platform_change_rate' as fractions of all rows.
+    """
+
+    def __init__(self, columns):
+        """Construct a DelayStats object.
+
+        :param dict|list columns: NumPy array per column as created by the *_to_columns functions, or a list of
+            those to combine
+        :raises:
+            - ImportError when NumPy is not installed
+        """
+        import numpy as np
+
+        if isinstance(columns, dict):
+            columns = [columns]
+        self.columns = {name: np.concatenate([part[name] for part in columns]) for name, _ in COLUMNS}
+
+    @classmethod
+    def from_departures(cls, departures, station=None, stations=None):
+        """Create the statistics for Departure objects; see departures_to_columns."""
+        return cls(departures_to_columns(departures, station, stations))
+
+    @classmethod
+    def from_trips(cls, trips, stations=None):
+        """Create the statistics for the stops of Trip objects; see trip_stops_to_columns."""
+        return cls(trip_stops_to_columns(trips, stations))
+
+    def __len__(self):
+        """Return the number of rows the statistics are computed over."""
+        return len(self.columns['delay'])
+
+    def _aggregate(self, groups, group_count):
+        """Compute the statistics for every group at once.
+
+        :param numpy.ndarray groups: group number of every row
+        :param int group_count: number of groups
+        :return: NumPy array per statistic, indexed by group number
+        :rtype: dict
+        """
+        import numpy as np
+
+        delay = self.columns['delay'].astype('float64')
+        cancelled = self.columns['cancelled']
+        count = np.bincount(groups, minlength=group_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = {
+                'count': count,
+                'cancellation_rate': np.bincount(groups, weights=cancelled, minlength=group_count) / count,
+                'platform_change_rate': np.bincount(
+                    groups, weights=self.columns['platform_changed'], minlength=group_count
+                )
+                / count,
+            }
+
+            # Delays of the trains that actually ran, sorted per group
+            running = ~cancelled
+            running_groups = groups[running]
+            running_delay = delay[running]
+            order = np.lexsort((running_delay, running_groups))
+            sorted_delay = running_delay[order]
+            running_count = np.bincount(running_groups, minlength=group_count)
+            starts = np.concatenate(([0], np.cumsum(running_count)[:-1]))
+            result['mean_delay'] = np.bincount(running_groups, weights=running_delay, minlength=group_count) / (
+                running_count
+            )
+            for name, fraction in (('median_delay', 0.5), ('p95_delay', 0.95)):
+                result[name] = self._percentile(sorted_delay, starts, running_count, fraction)
+        return result
+
+    @staticmethod
+    def _percentile(sorted_values, starts, counts, fraction):
+        """Compute a percentile (with linear interpolation) of every group in sorted_values at once."""
+        import numpy as np
+
+        result = np.full(len(counts), np.nan)
+        present = counts > 0
+        position = starts[present] + fraction * (counts[present] - 1)
+        low = np.floor(position).astype('int64')
+        high = np.ceil(position).astype('int64')
+        result[present] = sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+        return result
+
+    def overall(self):
+        """Return the statistics over all rows.
+
+        :rtype: dict
+        """
+        import numpy as np
+
+        aggregated = self._aggregate(np.zeros(len(self), dtype='int64'), 1)
+        return {name: values[0].item() for name, values in aggregated.items()}
+
+    def by(self, column):
+        """Return the statistics per value of a column.
+
+        :param str column: name of the column to group on, like 'station_code', 'train_type' or 'carrier'
+        :return: statistics per value of the column
+        :rtype: dict
+        """
+        return self._by_values(self.columns[column].tolist())
+
+    def _by_values(self, values):
+        """Return the statistics per value, given the value of every row."""
+        import numpy as np
+
+        codes = {value: index for index, value in enumerate(dict.fromkeys(values))}
+        groups = np.fromiter(map(codes.__getitem__, values), 'int64', len(values))
+        aggregated = self._aggregate(groups, len(codes))
+        return {
+            value: {name: values[index].item() for name, values in aggregated.items()} for value, index in codes.items()
+        }
+
+    def by_station(self):
+        """Return the statistics per station, by station code or, for rows without one, by station name."""
+        values = self.columns['station_code'].tolist()
+        if None in values:
+            values = [name if code is None else code for code, name in zip(values, self.columns['station_name'])]
+        return self._by_values(values)
+
+    def by_train_type(self):
+        """Return the statistics per train type."""
+        return self.by('train_type')
+
+    def by_carrier(self):
+        """Return the statistics per carrier."""
+        return self.by('carrier')
+
+
+def columns_to_dataframe(columns):
+    """Create a pandas DataFrame from the columns created by one of the *_to_columns functions.
+
+    :param dict columns: NumPy array per column
+    :rtype: pandas.DataFrame
+    :raises:
+        - ImportError when pandas is not installed
+    """
+    import pandas as pd
+
+    return pd.DataFrame(columns)
+
+
+################
+# Cache helpers
+################
+
+
+# Default number of seconds the parsed results of each endpoint stay cached
+DEFAULT_CACHE_TTLS = {
+    'stations': 24 * 60 * 60,
+    'disruptions': 60,
+    'departures': 15,
+    'trips': 30,
+}
+
+
+class ResponseCache:
+    """Thread-safe in-memory LRU cache for parsed API results, with an expiry time per endpoint.
+
+    Concurrent requests for the same uncached URL are coalesced: only one of them reaches the API, the others wait
+    for and share its result. Cached results are shared between callers too, so they should not be modified.
+    """
+
+    def __init__(self, max_entries=1024, ttls=None):
+        """Construct a ResponseCache object.
+
+        :param int max_entries: maximum number of results to keep; the least recently used one is evicted first
+        :param dict ttls: seconds to keep results per endpoint, overriding DEFAULT_CACHE_TTLS; 0 disables caching
+        """
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_CACHE_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = collections.OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of cached results."""
+        return len(self._entries)
+
+    @staticmethod
+    def normalise_key(url):
+        """Normalise a URL so the order of its parameters does not matter.
+
+        :param str url: path of the endpoint, including the query string
+        :return: the cache key for this URL
+        :rtype: str
+        """
+        import urllib.parse
+
+        path, _, query = url.partition('?')
+        return path + '?' + urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(query, keep_blank_values=True)))
+
+    def clear(self):
+        """Remove all cached results."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_fetch(self, endpoint, url, fetch, timeout=None, variant=None):
+        """Return the cached result for this URL, or fetch (and cache) it.
+
+        :param str endpoint: name of the endpoint, used to look up the expiry time
+        :param str url: path of the endpoint, including the query string
+        :param callable fetch: function without arguments that requests and parses the result
+        :param float timeout: seconds to wait for the result of the same request made by another thread; None waits
+            until it is done
+        :param variant: tells apart results parsed differently from the same URL, like lazily parsed trips
+        :return: the (possibly cached) result of fetch
+        :raises:
+            - TimeoutError when the request made by another thread is not done within timeout
+        """
+        import concurrent.futures
+
+        key = (self.normalise_key(url), variant)
+        leader = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            pending = self._in_flight.get(key)
+            if pending is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                pending = self._in_flight[key] = concurrent.futures.Future()
+                leader = True
+        if not leader:
+            try:
+                return pending.result(timeout)
+            except concurrent.futures.TimeoutError:
+                # Not the builtin TimeoutError before Python 3.11
+                raise TimeoutError('Timed out waiting for {0}'.format(url)) from None
+
+        try:
+            result = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            pending.set_exception(e)
+            raise
+        ttl = self.ttls.get(endpoint, 0)
+        with self._lock:
+            del self._in_flight[key]
+            if ttl > 0 and result is not None:
+                self._entries[key] = (time.monotonic() + ttl, result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        pending.set_result(result)
+        return result
+
+
+##################
+# Response archive
+##################
+
+
+def url_endpoint(url):
+    """Find out which endpoint a URL of the API belongs to, and for which station it was requested.
+
+    :param str url: path of the endpoint, including the query string
+    :return: name of the endpoint (like 'departures') and the station code (None when not for one station)
+    :rtype: tuple
+    """
+    import urllib.parse
+
+    path, _, query = url.partition('?')
+    # The URL builders send parameters that were not given as the string 'None'
+    params = {name: value for name, value in urllib.parse.parse_qsl(query) if value != 'None'}
+    parts = path.rstrip('/').split('/')
+    if 'disruptions' in parts:
+        if 'station' in parts:
+            return 'disruptions', parts[parts.index('station') + 1]
+        return 'disruptions', None
+    endpoint = parts[-1]
+    if endpoint == 'trips':
+        return endpoint, params.get('fromStation')
+    return endpoint, params.get('station') or params.get('uicCode')
+
+
+class ResponseArchive:
+    """Append-only store of raw API responses in an SQLite database, to query and replay them later.
+
+    Responses are stored zlib-compressed and indexed on endpoint, station and the time they were recorded at.
+    """
+
+    def __init__(self, path, compress_level=6):
+        """Construct a ResponseArchive object, creating the database when needed.
+
+        :param str path: path of the SQLite database file
+        :param int compress_level: zlib compression level for the responses, 0-9
+        """
+        import sqlite3
+
+        self.path = path
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'id INTEGER PRIMARY KEY, endpoint TEXT NOT NULL, station TEXT, url TEXT NOT NULL, '
+            'recorded_at REAL NOT NULL, body BLOB NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS responses_station ON responses (endpoint, station, recorded_at)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_time ON responses (endpoint, recorded_at)')
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+    def record(self, url, data, recorded_at=None):
+        """Store a raw response.
+
+        :param str url: path of the endpoint the response came from, including the query string
+        :param str data: raw response of the API
+        :param float recorded_at: when the response was received, in seconds since the epoch; defaults to now
+        """
+        endpoint, station = url_endpoint(url)
+        if recorded_at is None:
+            recorded_at = time.time()
+        body = zlib.compress(data.encode('UTF-8'), self.compress_level)
+        with self._lock:
+            self._connection.execute(
+                'INSERT INTO responses (endpoint, station, url, recorded_at, body) VALUES (?, ?, ?, ?, ?)',
+                (endpoint, station, url, recorded_at, body),
+            )
+
+    def query(self, endpoint=None, station=None, since=None, until=None):
+        """Yield the stored responses matching all of the given criteria, oldest first.
+
+        :param str endpoint: name of the endpoint, like 'departures', 'trips', 'disruptions' or 'stations'
+        :param str station: station code the response was requested for
+        :param float since: only responses recorded at or after this time, in seconds since the epoch
+        :param float until: only responses recorded before this time, in seconds since the epoch
+        :return: generator of (recorded_at, url, raw response) tuples
+        """
+        conditions = []
+        values = []
+        for condition, value in (
+            ('endpoint = ?', endpoint),
+            ('station = ?', station),
+            ('recorded_at >= ?', since),
+            ('recorded_at < ?', until),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                values.append(value)
+        sql = 'SELECT recorded_at, url, body FROM responses'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY recorded_at, id'
+        with self._lock:
+            rows = self._connection.execute(sql, values).fetchall()
+        for recorded_at, url, body in rows:
+            yield recorded_at, url, zlib.decompress(body).decode('UTF-8')
+
+    def replay(self, endpoint, station=None, since=None, until=None):
+        """Yield the stored responses of an endpoint parsed into model objects, oldest first.
+
+        See query for the parameters. Responses that can not be parsed, like error bodies stored by older versions, are
+        reported and skipped.
+
+        :return: generator of (recorded_at, parsed result) tuples, in the format of the matching NSAPI.parse_* method
+        """
+        for recorded_at, url, data in self.query(endpoint, station, since, until):
+            try:
+                parsed = NSAPI.parse_response(url, data)
+            except (ValueError, KeyError, TypeError, NoDataReceivedError, RequestParametersError) as e:
+                print('Skipping archived response of {0} recorded at {1}: {2!r}'.format(url, recorded_at, e))
+                continue
+            yield recorded_at, parsed
+
+
+#####################
+# Throttling helpers
+#####################
+
+
+# HTTP statuses worth another try: too many requests, and temporary problems of the gateway
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+def retry_errors():
+    """Return the errors worth another try: connection problems, and broken or cut off responses.
+
+    A function instead of a constant, so that http.client is only imported once a request is made.
+
+    :rtype: tuple
+    """
+    import http.client
+
+    return (OSError, EOFError, http.client.HTTPException)
+
+
+def parse_retry_after(value):
+    """Parse the value of a Retry-After header, either a number of seconds or an HTTP date.
+
+    :param str value: value of the header, or None
+    :return: number of seconds to wait, or None when the value is missing or invalid
+    :rtype: float
+    """
+    import email.utils
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """Thread-safe token bucket, to stay within the request quota of the subscription.
+
+    Tokens are reserved in order of arrival, so waiting callers are served first come, first served without polling.
+    """
+
+    def __init__(self, rate, burst=None):
+        """Construct a RateLimiter object.
+
+        :param float rate: number of requests allowed per second, on average
+        :param int burst: number of requests that may be made at once after a quiet period; defaults to rate
+        """
+        self.rate = rate
+        self.burst = max(1.0, rate if burst is None else burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, timeout=None):
+        """Take a token, going into debt when none is left.
+
+        :param float timeout: maximum number of seconds to wait; None waits as long as needed
+        :return: number of seconds to wait before the token may be used, or None when that is more than timeout
+        :rtype: float
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            wait = max(wait, self._paused_until - now)
+            if timeout is not None and wait > timeout:
+                # Hand the token back, it will not be used
+                self._tokens += 1
+                return None
+            return wait
+
+    def acquire(self, timeout=None):
+        """Wait until a request may be made.
+
+        :param float timeout: maximum number of seconds to wait; None waits as long as needed
+        :return: False when no request may be made within timeout, without waiting at all
+        :rtype: bool
+        """
+        wait = self._reserve(timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self):
+        """Wait until a request may be made, without blocking the event loop."""
+        import asyncio
+
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back all requests for some time, for example when the API answered with a Retry-After header.
+
+        :param float seconds: number of seconds from now
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RetryPolicy:
+    """When and how long to wait before repeating a request that failed for a transient reason."""
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30, statuses=RETRY_STATUSES):
+        """Construct a RetryPolicy object.
+
+        :param int max_retries: maximum number of times a request is repeated; 0 disables retrying
+        :param float backoff: base number of seconds for the exponential backoff
+        :param float max_backoff: maximum number of seconds to wait between attempts, unless the API asks for more
+        :param set statuses: HTTP statuses of the responses that are retried
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+
+    def delay(self, attempt, retry_after=None):
+        """Return the number of seconds to wait before the next attempt.
+
+        Without a Retry-After value from the API, this is a random time up to an exponentially growing ceiling ("full
+        jitter"), so clients that failed together do not all come back at the same moment.
+
+        :param int attempt: number of the attempt that failed, starting at 0
+        :param float retry_after: number of seconds the API asked to wait, if any
+        """
+        import random
+
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+###################
+# Content encoding
+###################
+
+
+@functools.lru_cache(maxsize=None)
+def _brotli():
+    """Return the brotli module (or the compatible brotlicffi module) when installed, otherwise None."""
+    try:
+        import brotli
+    except ImportError:
+        try:
+            import brotlicffi as brotli
+        except ImportError:
+            return None
+    return brotli
+
+
+def accept_encoding():
+    """Return the value for the Accept-Encoding request header, only offering brotli when it can be decoded."""
+    if _brotli() is not None:
+        return 'br, gzip, deflate'
+    return 'gzip, deflate'
+
+
+class _BrotliDecompressor:
+    """Incremental brotli decompressor, with the interface of zlib.decompressobj()."""
+
+    def __init__(self):
+        """Construct a _BrotliDecompressor object."""
+        self._decompressor = _brotli().Decompressor()
+
+    def decompress(self, data):
+        """Decompress the next chunk of the body."""
+        return self._decompressor.process(data)
+
+    def flush(self):
+        """Return what is left of the body; brotli hands out everything in decompress() already."""
+        return b''
+
+
+def content_decompressor(encoding):
+    """Create a decompressor for a body with this Content-Encoding, which is fed the body chunk by chunk.
+
+    :param str encoding: value of the Content-Encoding response header, or None
+    :return: object with decompress(chunk) and flush() methods, or None when the body is not compressed
+    :raises:
+        - ValueError when the encoding is not supported
+    """
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return None
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    if encoding == 'br' and _brotli() is not None:
+        return _BrotliDecompressor()
+    raise ValueError('Unsupported Content-Encoding {0}'.format(encoding))
+
+
+def decode_content(data, encoding):
+    """Decompress a complete body with this Content-Encoding.
+
+    :param bytes data: body of the response
+    :param str encoding: value of the Content-Encoding response header, or None
+    :return: the decompressed body
+    :rtype: bytes
+    """
+    decompressor = content_decompressor(encoding)
+    if decompressor is None:
+        return data
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def decode_content_stream(chunks, encoding):
+    """Decompress a body with this Content-Encoding while its chunks come in.
+
+    :param chunks: iterable of the bytes chunks of the body
+    :param str encoding: value of the Content-Encoding response header, or None
+    :return: generator of decompressed chunks
+    """
+    decompressor = content_decompressor(encoding)
+    if decompressor is None:
+        yield from chunks
+        return
+    for chunk in chunks:
+        yield decompressor.decompress(chunk)
+    yield decompressor.flush()
+
+
+#####################
+# Connection helpers
+#####################
+
+
+NS_API_HOST = 'gateway.apiportal.ns.nl'
+
+# Errors that indicate a kept-alive socket was closed by the other side in the meantime; http.client reports an empty
+# response as RemoteDisconnected, which is a ConnectionResetError
+STALE_CONNECTION_ERRORS = (ConnectionError,)
+
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTPS connections to a single host."""
+
+    def __init__(self, host=NS_API_HOST, max_connections=10, idle_timeout=30, connect_timeout=None, read_timeout=None):
+        """Construct a ConnectionPool object.
+
+        :param str host: hostname to connect to
+        :param int max_connections: maximum number of simultaneously open connections
+        :param float idle_timeout: seconds after which an unused connection is discarded
+        :param float connect_timeout: default seconds to wait for a connection to be set up; None waits forever
+        :param float read_timeout: default seconds to wait for data from the host; None waits forever
+        """
+        self.host = host
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _new_connection(self):
+        """Create a fresh, not yet connected, HTTPS connection."""
+        import http.client
+
+        return http.client.HTTPSConnection(self.host)
+
+    def _acquire(self, timeout=None):
+        """Take a connection from the pool, blocking while all of them are in use.
+
+        :param float timeout: seconds to wait for a connection to come free; None waits forever
+        :return: the connection and whether it was reused from the pool
+        :rtype: tuple
+        :raises:
+            - TimeoutError when no connection came free within timeout
+        """
+        if not self._slots.acquire(timeout=None if timeout is None else max(timeout, 0)):
+            raise TimeoutError('No free connection within {0:.3f} seconds'.format(timeout))
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                # Most recently used connection first, as it is the most likely to still be alive
+                conn, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    return conn, True
+                conn.close()
+        return self._new_connection(), False
+
+    def _release(self, conn, reusable=True):
+        """Hand a connection back to the pool, or close it when it cannot be reused."""
+        if reusable:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        else:
+            conn.close()
+        self._slots.release()
+
+    @staticmethod
+    def _send(conn, method, url, body, headers, connect_timeout, read_timeout):
+        """Connect when needed and send the request, with these timeouts.
+
+        :return: the response object
+        """
+        if conn.sock is None:
+            conn.timeout = connect_timeout
+            conn.connect()
+        conn.sock.settimeout(read_timeout)
+        conn.request(method, url, body, headers)
+        return conn.getresponse()
+
+    @contextlib.contextmanager
+    def stream(
+        self, method, url, body=None, headers=None, connect_timeout=None, read_timeout=None, acquire_timeout=None
+    ):
+        """Perform a request over a pooled connection, handing out the response before its body is read.
+
+        A reused connection that turns out to be stale is replaced by a new one and the request is sent again. The
+        connection goes back to the pool only when the body was read completely.
+
+        :param str method: HTTP method ('GET' or 'POST')
+        :param str url: path of the endpoint, including the query string
+        :param str body: request body
+        :param dict headers: request headers
+        :param float connect_timeout: seconds to wait for a new connection; defaults to that of the pool
+        :param float read_timeout: seconds to wait for data of the response; defaults to that of the pool
+        :param float acquire_timeout: seconds to wait for a free connection when all are in use; None waits forever
+        :return: context manager yielding the response object
+        """
+        headers = headers or {}
+        timeouts = (
+            self.connect_timeout if connect_timeout is None else connect_timeout,
+            self.read_timeout if read_timeout is None else read_timeout,
+        )
+        conn, reused = self._acquire(acquire_timeout)
+        try:
+            try:
+                response = self._send(conn, method, url, body, headers, *timeouts)
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                conn.close()
+                conn = self._new_connection()
+                response = self._send(conn, method, url, body, headers, *timeouts)
+            yield response
+        except BaseException:
+            self._release(conn, reusable=False)
+            raise
+        if response.length == 0:
+            # Body read completely through read1(), which does not close the response by itself
+            response.close()
+        self._release(conn, reusable=response.isclosed() and not response.will_close)
+
+    def request(
+        self, method, url, body=None, headers=None, connect_timeout=None, read_timeout=None, acquire_timeout=None
+    ):
+        """Perform a request over a pooled connection.
+
+        :param str method: HTTP method ('GET' or 'POST')
+        :param str url: path of the endpoint, including the query string
+        :param str body: request body
+        :param dict headers: request headers
+        :param float connect_timeout: seconds to wait for a new connection; defaults to that of the pool
+        :param float read_timeout: seconds to wait for data of the response; defaults to that of the pool
+        :param float acquire_timeout: seconds to wait for a free connection when all are in use; None waits forever
+        :return: the response object and its (raw) body
+        :rtype: tuple
+        """
+        with self.stream(method, url, body, headers, connect_timeout, read_timeout, acquire_timeout) as response:
+            data = response.read()
+        return response, data
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                conn.close()
+
+
+class AsyncConnectionPool:
+    """Pool of keep-alive HTTPS connections to a single host, for use with asyncio.
+
+    Speaks just enough HTTP/1.1 for the NS API: a request with a body and headers, and a response with either a
+    Content-Length or a chunked body.
+    """
+
+    def __init__(self, host=NS_API_HOST, max_connections=100, idle_timeout=30, connect_timeout=None, read_timeout=None):
+        """Construct an AsyncConnectionPool object.
+
+        :param str host: hostname to connect to
+        :param int max_connections: maximum number of simultaneously open connections
+        :param float idle_timeout: seconds after which an unused connection is discarded
+        :param float connect_timeout: seconds to wait for a connection to be set up; None waits forever
+        :param float read_timeout: seconds to wait for the complete response; None waits forever
+        """
+        import asyncio
+
+        self.host = host
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = collections.deque()
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def _open_connection(self):
+        """Open a new connection to the host.
+
+        :return: stream reader and writer of the connection
+        :rtype: tuple
+        """
+        import asyncio
+
+        return await asyncio.open_connection(self.host, 443, ssl=True)
+
+    @staticmethod
+    async def _close_connection(writer):
+        """Close a connection without caring whether the other side already did."""
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    async def _acquire(self):
+        """Take a connection from the pool, waiting while all of them are in use.
+
+        :return: reader, writer and whether the connection was reused from the pool
+        :rtype: tuple
+        """
+        import asyncio
+
+        await self._slots.acquire()
+        now = time.monotonic()
+        try:
+            while self._idle:
+                reader, writer, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout and not reader.at_eof():
+                    return reader, writer, True
+                await self._close_connection(writer)
+            reader, writer = await asyncio.wait_for(self._open_connection(), self.connect_timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+        return reader, writer, False
+
+    async def _release(self, reader, writer, reusable=True):
+        """Hand a connection back to the pool, or close it when it cannot be reused."""
+        if reusable:
+            self._idle.append((reader, writer, time.monotonic()))
+        else:
+            await self._close_connection(writer)
+        self._slots.release()
+
+    async def _send(self, reader, writer, method, url, body, headers):
+        """Write the request and read back the response.
+
+        :return: status code, headers (with lowercase names), body, and whether the connection can be reused
+        :rtype: tuple
+        """
+        lines = ['{0} {1} HTTP/1.1'.format(method, url), 'Host: {0}'.format(self.host)]
+        for name, value in headers.items():
+            lines.append('{0}: {1}'.format(name, value))
+        if body is None:
+            # Like http.client, a request without a body gets no Content-Length
+            body = b''
+        else:
+            body = body.encode('UTF-8') if isinstance(body, str) else body
+            lines.append('Content-Length: {0}'.format(len(body)))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Remote end closed connection without response')
+        status = int(status_line.split(None, 2)[1])
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        reusable = response_headers.get('connection', '').lower() != 'close'
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';', 1)[0], 16)
+                if size == 0:
+                    # Skip the (optional) trailer headers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await reader.read()
+            reusable = False
+        return status, response_headers, data, reusable
+
+    async def request(self, method, url, body=None, headers=None):
+        """Perform a request over a pooled connection.
+
+        A reused connection that turns out to be stale is replaced by a new one and the request is sent again.
+
+        :param str method: HTTP method ('GET' or 'POST')
+        :param str url: path of the endpoint, including the query string
+        :param str body: request body
+        :param dict headers: request headers
+        :return: status code, headers (with lowercase names) and the (raw) body of the response
+        :rtype: tuple
+        """
+        import asyncio
+
+        headers = headers or {}
+        reader, writer, reused = await self._acquire()
+        try:
+            try:
+                status, response_headers, data, reusable = await asyncio.wait_for(
+                    self._send(reader, writer, method, url, body, headers), self.read_timeout
+                )
+            except (*STALE_CONNECTION_ERRORS, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                await self._close_connection(writer)
+                reader, writer = await asyncio.wait_for(self._open_connection(), self.connect_timeout)
+                status, response_headers, data, reusable = await asyncio.wait_for(
+                    self._send(reader, writer, method, url, body, headers), self.read_timeout
+                )
+        except BaseException:
+            await self._release(reader, writer, reusable=False)
+            raise
+        await self._release(reader, writer, reusable=reusable)
+        return status, response_headers, data
+
+    async def close(self):
+        """Close all idle connections."""
+        while self._idle:
+            _, writer, _ = self._idle.pop()
+            await self._close_connection(writer)
+
+
+###############
+# Main library
+###############
+
+
+# Endpoints that rarely change, for which the validators of the last response are sent along with the next request
+CONDITIONAL_ENDPOINTS = frozenset(('stations', 'disruptions'))
+
+
+class NSAPI:
+    """NS API object.
+
+    Library to query the official Dutch railways API.
+    """
+
+    def __init__(
+        self,
+        subscription_key,
+        max_connections=10,
+        idle_timeout=30,
+        cache=None,
+        archive=None,
+        rate_limiter=None,
+        retry=None,
+        connect_timeout=10,
+        read_timeout=30,
+        station_snapshot=None,
+    ):
+        """Construct the NS API library object.
+
+        :param str subscription_key: NS API subscription key
+        :param int max_connections: maximum number of simultaneous keep-alive connections to the API
+        :param float idle_timeout: seconds after which an unused keep-alive connection is discarded
+        :param ResponseCache cache: optional cache for the parsed results; no caching when None
+        :param ResponseArchive archive: optional archive to record every raw response in
+        :param RateLimiter rate_limiter: optional limiter of the request rate, which can be shared between clients
+        :param RetryPolicy retry: when to repeat failed requests; defaults to RetryPolicy()
+        :param float connect_timeout: seconds to wait for a connection to the API to be set up; None waits forever
+        :param float read_timeout: seconds to wait for data from the API; None waits forever
+        :param StationSnapshot station_snapshot: optional file to keep the station list in between runs
+        """
+        self.subscription_key = subscription_key
+        self.cache = cache
+        self.station_snapshot = station_snapshot
+        self.archive = archive
+        self.rate_limiter = rate_limiter
+        self.retry = RetryPolicy() if retry is None else retry
+        # Per URL: the ETag and Last-Modified validators of the last response, and its parsed result
+        self._validators = {}
+        self._validators_lock = threading.Lock()
+        self._pool = ConnectionPool(
+            NS_API_HOST,
+            max_connections=max_connections,
+            idle_timeout=idle_timeout,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+        )
+
+    def close(self):
+        """Close the idle connections to the API."""
+        self._pool.close()
+
+    def _attempt(self, method, url, headers, deadline=None, timeouts=None):
+        """Make a single attempt at a request, within what is left of the time until deadline.
+
+        :param float deadline: time.monotonic() value by which the request has to be finished, or None
+        :param tuple timeouts: connect and read timeout in seconds for this request; None (for either) uses the default
+        :return: the response object and its (raw) body
+        :rtype: tuple
+        :raises:
+            - TimeoutError when the deadline has passed, or would pass while waiting for the rate limiter or for a free
+              connection
+        """
+        connect_timeout, read_timeout = (
+            default if timeout is None else timeout
+            for timeout, default in zip(timeouts or (None, None), (self._pool.connect_timeout, self._pool.read_timeout))
+        )
+        if deadline is None:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            return self._pool.request(method, url, None, headers, connect_timeout, read_timeout)
+        if self.rate_limiter is not None and not self.rate_limiter.acquire(deadline - time.monotonic()):
+            raise TimeoutError('Deadline exceeded')
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError('Deadline exceeded')
+        connect_timeout, read_timeout = (
+            remaining if timeout is None else min(timeout, remaining) for timeout in (connect_timeout, read_timeout)
+        )
+        return self._pool.request(method, url, None, headers, connect_timeout, read_timeout, remaining)
+
+    def _request(self, method, url, postdata=None, params=None, deadline=None, timeouts=None):
+        """Make a request to the NS API.
+
+        :param str method: HTTP method ('GET' or 'POST')
+        :param str url: exact URL of the API endpoint
+        :param dict postdata: POST data
+        :param dict params: URL parameters
+        :param float deadline: time.monotonic() value by which the request, retries included, has to be finished
+        :param tuple timeouts: connect and read timeout in seconds for this request; None (for either) uses the default
+        """
+        return self._request_response(method, url, deadline, timeouts=timeouts)[1]
+
+    def _request_response(self, method, url, deadline=None, extra_headers=None, timeouts=None):
+        """Make a request to the NS API, also handing out the response object for its status and headers.
+
+        :param str method: HTTP method ('GET' or 'POST')
+        :param str url: exact URL of the API endpoint
+        :param float deadline: time.monotonic() value by which the request, retries included, has to be finished
+        :param dict extra_headers: further request headers
+        :param tuple timeouts: connect and read timeout in seconds for this request; None (for either) uses the default
+        :return: the response object and its decoded body, or None and None when the request failed
+        :rtype: tuple
+        """
+        headers = {
+            # Request headers
+            'Ocp-Apim-Subscription-Key': self.subscription_key,
+            'Accept-Encoding': accept_encoding(),
+        }
+        if extra_headers:
+            headers.update(extra_headers)
+        attempt = 0
+        while True:
+            try:
+                response, data = self._attempt(method, url, headers, deadline, timeouts)
+                data = decode_content(data, response.getheader('Content-Encoding'))
+                retry_after = parse_retry_after(response.getheader('Retry-After'))
+                failed = response.status in self.retry.statuses
+            except retry_errors() as e:
+                data, retry_after, failed = e, None, True
+            except Exception as e:
+                print('Error during connection: {0}'.format(e))
+                return None, None
+            delay = self.retry.delay(attempt, retry_after) if failed else 0
+            if (
+                not failed
+                or attempt >= self.retry.max_retries
+                or (deadline is not None and time.monotonic() + delay >= deadline)
+            ):
+                break
+            if retry_after is not None and self.rate_limiter is not None:
+                self.rate_limiter.pause(retry_after)
+            time.sleep(delay)
+            attempt += 1
+        if isinstance(data, Exception):
+            print('Error during connection: {0}'.format(data))
+            return None, None
+        data = data.decode('UTF-8')
+        if self.archive is not None and response.status == 200 and data:
+            # Only successful responses are worth replaying; errors and rate limit answers are not archived
+            self.archive.record(url, data)
+        return response, data
+
+    def _request_stream(self, method, url):
+        """Make a request to the NS API, yielding the body of the response in chunks as they come in.
+
+        :param str method: HTTP method ('GET' or 'POST')
+        :param str url: exact URL of the API endpoint
+        """
+        headers = {
+            # Request headers
+            'Ocp-Apim-Subscription-Key': self.subscription_key,
+            'Accept-Encoding': accept_encoding(),
+        }
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        try:
+            with self._pool.stream(method, url, None, headers) as response:
+                if response.status != 200:
+                    # Read the error body, so the connection can be reused
+                    response.read()
+                    print('Error during connection: HTTP {0} {1}'.format(response.status, response.reason))
+                    return
+                chunks = iter(functools.partial(response.read1, JSON_STREAM_CHUNK_SIZE), b'')
+                yield from decode_content_stream(chunks, response.getheader('Content-Encoding'))
+        except Exception as e:
+            print('Error during connection: {0}'.format(e))
+
+    def _iter_stream(self, url, parse_stream, *args):
+        """Request the URL and parse its items while the response is coming in.
+
+        :param str url: exact URL of the API endpoint
+        :param callable parse_stream: generator function parsing the chunks of the response
+        :param args: further arguments for parse_stream
+        """
+        chunks = self._request_stream('GET', url)
+        try:
+            yield from parse_stream(chunks, *args)
+            # Read what is left of the response, so the connection can be reused
+            for _ in chunks:
+                pass
+        finally:
+            chunks.close()
+
+    def _fetch(self, url, parse, deadline=None, timeouts=None):
+        """Request the URL and parse the result.
+
+        :param str url: exact URL of the API endpoint
+        :param callable parse: function turning the raw response into the result
+        :param float deadline: time.monotonic() value by which the request, retries included, has to be finished
+        :param tuple timeouts: connect and read timeout in seconds for this request; None (for either) uses the default
+        :return: the parsed result
+        """
+        return parse(self._request('GET', url, deadline=deadline, timeouts=timeouts))
+
+    def _fetch_conditional(self, url, parse, deadline=None, timeouts=None):
+        """Request the URL with the validators of the previous response, reusing its parsed result when unchanged.
+
+        See _fetch for the parameters.
+        """
+        with self._validators_lock:
+            previous = self._validators.get(url)
+        headers = {}
+        if previous is not None:
+            etag, last_modified, _ = previous
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response, data = self._request_response('GET', url, deadline, headers, timeouts)
+        if response is not None and response.status == 304 and previous is not None:
+            return previous[2]
+        result = parse(data)
+        if response is not None and response.status == 200:
+            etag = response.getheader('ETag')
+            last_modified = response.getheader('Last-Modified')
+            with self._validators_lock:
+                if etag or last_modified:
+                    self._validators[url] = (etag, last_modified, result)
+                else:
+                    self._validators.pop(url, None)
+        return result
+
+    def _get(self, endpoint, url, parse, deadline=None, variant=None, timeouts=None):
+        """Request the URL and parse the result, going through the cache when one is configured.
+
+        Endpoints in CONDITIONAL_ENDPOINTS are requested conditionally, see _fetch_conditional.
+
+        :param str endpoint: name of the endpoint, used to look up the cache expiry time
+        :param str url: exact URL of the API endpoint
+        :param callable parse: function turning the raw response into the result
+        :param float deadline: maximum number of seconds the request may take, retries included; None for no limit
+        :param variant: tells apart differently parsed results of the same URL in the cache, like lazily parsed trips
+        :param tuple timeouts: connect and read timeout in seconds for this request; None (for either) uses the default
+        :return: the parsed result
+        :raises:
+            - TimeoutError when the deadline passes while waiting for the same request made by another thread
+        """
+        timeout = deadline
+        if deadline is not None:
+            deadline = time.monotonic() + deadline
+        fetch = self._fetch_conditional if endpoint in CONDITIONAL_ENDPOINTS else self._fetch
+        if self.cache is None:
+            return fetch(url, parse, deadline, timeouts)
+        return self.cache.get_or_fetch(
+            endpoint, url, functools.partial(fetch, url, parse, deadline, timeouts), timeout, variant
+        )
+
+    @staticmethod
+    def parse_response(url, data):
+        """Parse a raw response with the parse method matching the endpoint of its URL.
+
+        :param str url: path of the endpoint the response came from, including the query string
+        :param str data: raw JSON result from the NS API
+        :return: the parsed result, in the format of the matching parse_* method
+        """
+        import urllib.parse
+
+        endpoint, _ = url_endpoint(url)
+        if endpoint == 'departures':
+            return NSAPI.parse_departures(data)
+        if endpoint == 'disruptions':
+            return NSAPI.parse_disruptions(data)
+        if endpoint == 'stations':
+            return NSAPI.parse_stations(data)
+        if endpoint == 'trips':
+            params = dict(urllib.parse.parse_qsl(url.partition('?')[2]))
+            requested_time = None
+            if params.get('dateTime'):
+                local_time = datetime.strptime(params['dateTime'], '%Y-%m-%dT%H:%M')
+                requested_time = local_time.replace(tzinfo=local_offset_timezone(local_time))
+            return NSAPI.parse_trips(data, requested_time)
+        raise RequestParametersError('Unknown endpoint {0}'.format(endpoint))
+
+    @staticmethod
+    def parse_disruptions(data):
+        """Parse the NS API JSON result into Disruption objects.
+
+        :param str data: raw JSON result from the NS API
+        :raises:
+            - NoDataReceivedError when the NS API did not return data
+        """
+        if not data:
+            raise NoDataReceivedError('No disruptions were returned')
+        obj = json.loads(data)
+        disruptions = {'unplanned': [], 'planned': []}
+        if obj['payload']:
+            raw_disruptions = obj['payload']
+            if isinstance(raw_disruptions, collections.OrderedDict):
+                raw_disruptions = [raw_disruptions]
+            for disruption in raw_disruptions:
+                if disruption['type'] == 'storing' or disruption['type'] == 'verstoring':
+                    new_disruption = Disruption(disruption)
+                    disruptions['unplanned'].append(new_disruption)
+                elif disruption['type'] == 'werkzaamheid':
+                    new_disruption = Disruption(disruption)
+                    disruptions['planned'].append(new_disruption)
+        return disruptions
+
+    @staticmethod
+    def _disruptions_url(station=None, actual=True, unplanned=True):
+        """Build the URL to fetch the disruptions with; see get_disruptions."""
+        import urllib.parse
+
+        params = urllib.parse.urlencode(
+            {
+                # Request parameters
+                'actual': actual,
+                'lang': 'nl',
+            }
+        )
+        if station is None:
+            return '/reisinformatie-api/api/v2/disruptions?%s' % params
+        return '/reisinformatie-api/api/v2/disruptions/station/%s?%s' % (
+            station,
+            params,
+        )
+
+    def get_disruptions(
+        self, station=None, actual=True, unplanned=True, deadline=None, connect_timeout=None, read_timeout=None
+    ):
+        """Fetch the current disruptions, or even the planned ones.
+
+        :param str station: station to lookup
+        :param bool actual: only actual disruptions
+        :param bool unplanned: only unplanned disruptions
+        :param float deadline: maximum number of seconds the request may take, retries included; None for no limit
+        :param float connect_timeout: seconds to wait for a connection to be set up; defaults to that of the client
+        :param float read_timeout: seconds to wait for data from the API; defaults to that of the client
+        """
+        url = self._disruptions_url(station, actual, unplanned)
+        return self._get('disruptions', url, self.parse_disruptions, deadline, timeouts=(connect_timeout, read_timeout))
+
+    @staticmethod
+    def parse_departures(data):
+        """Parse the NS API JSON result into Departure objects.
+
+        :param str data: raw JSON result from the NS API
+        :raises:
+            - NoDataReceivedError when the NS API did not return data
+        """
+        if not data:
+            raise NoDataReceivedError('No departures were returned')
+        obj = json.loads(data)
+        departures = []
+
+        for departure in obj['payload']['departures']:
+            new_departure = Departure(departure)
+            departures.append(new_departure)
+
+        return departures
+
+    @staticmethod
+    def _departures_url(station=None, for_datetime=None, max_journeys='25', uic_code=None, source=None):
+        """Build the URL to fetch the departures with; see get_departures."""
+        import urllib.parse
+
+        params = urllib.parse.urlencode(
+            {
+                # Request parameters
+                'dateTime': for_datetime,
+                'maxJourneys': max_journeys,
+                'lang': 'nl',
+                'station': station,
+                'uicCode': uic_code,
+                'source': source,
+            }
+        )
+        return '/reisinformatie-api/api/v2/departures?%s' % params
+
+    @staticmethod
+    def parse_departures_stream(stream):
+        """Parse the NS API JSON result into Departure objects, yielding each one as soon as it has been read.
+
+        :param stream: raw JSON result from the NS API, as file-like object or iterable of chunks
+        :raises:
+            - NoDataReceivedError when the NS API did not return data
+        """
+        for departure in JSONStreamReader(stream).iter_array(('payload', 'departures')):
+            yield Departure(departure)
+
+    def get_departures(
+        self,
+        station=None,
+        for_datetime=None,
+        max_journeys='25',
+        uic_code=None,
+        source=None,
+        deadline=None,
+        connect_timeout=None,
+        read_timeout=None,
+    ):
+        """Fetch the current departure times from this station.
+
+        :param str station: station to lookup
+        :param str for_datetime: Format - date-time (as date-time in RFC3339)
+        :param str max_journeys: int32. number of departures or arrivals to return
+        :param str uic_code: specify a station by UIC code (84xxxxx)
+        :param str source: forces to use a certain source
+        :param float deadline: maximum number of seconds the request may take, retries included; None for no limit
+        :param float connect_timeout: seconds to wait for a connection to be set up; defaults to that of the client
+        :param float read_timeout: seconds to wait for data from the API; defaults to that of the client
+        """
+        url = self._departures_url(station, for_datetime, max_journeys, uic_code, source)
+        return self._get('departures', url, self.parse_departures, deadline, timeouts=(connect_timeout, read_timeout))
+
+    def iter_departures(
+        self,
+        station=None,
+        for_datetime=None,
+        max_journeys='25',
+        uic_code=None,
+        source=None,
+    ):
+        """Fetch the departure times from this station, yielding each departure as soon as it has been read.
+
+        Unlike get_departures, this does not use the cache. See get_departures for the parameters.
+        """
+        url = self._departures_url(station, for_datetime, max_journeys, uic_code, source)
+        return self._iter_stream(url, self.parse_departures_stream)
+
+    def get_departures_bulk(self, stations, max_workers=None, **kwargs):
+        """Fetch the departures for a number of stations at once, using a pool of worker threads.
+
+        A failure for one station does not abort the others; its exception is returned in place of its departures.
+
+        :param list stations: station codes to look up
+        :param int max_workers: number of worker threads; defaults to the maximum number of connections
+        :param kwargs: further arguments for get_departures, applied to every station
+        :return: the departures per station code, or the exception raised for that station
+        :rtype: dict
+        """
+        import concurrent.futures
+
+        stations = list(stations)
+        if not stations:
+            return {}
+        if max_workers is None:
+            max_workers = self._pool.max_connections
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(stations))) as executor:
+            futures = {executor.submit(self.get_departures, station, **kwargs): station for station in stations}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = e
+        # Keep the order in which the stations were requested
+        return {station: results[station] for station in stations}
+
+    @staticmethod
+    def parse_trips(data, requested_time, lazy=False):
+        """Parse the NS API JSON result into Trip objects.
 
         :param str data: 'raw' response from API
         :param datetime requested_time: Timestamp to look up the possibilities for
+        :param bool lazy: only parse the parts and stops of a trip when they are first accessed
         :return: list of the available trips
         :rtype: list
         :raises:
@@ -997,7 +3743,7 @@ class NSAPI:
 
         try:
             for trip in obj['trips']:
-                new_trip = Trip(trip, requested_time)
+                new_trip = Trip(trip, requested_time, lazy=lazy)
                 trips.append(new_trip)
         except TypeError:
             # If no options are found, obj['ReisMogelijkheden'] is None
@@ -1005,42 +3751,43 @@ class NSAPI:
 
         return trips
 
-    def get_trips(
-        self,
-        timestamp,
-        start,
-        via,
-        destination,
-        departure=True,
-        prev_advices=1,
-        next_advices=1,
-    ):
-        """Fetch trip possibilities for these parameters.
+    @staticmethod
+    def parse_trips_stream(stream, requested_time, lazy=False):
+        """Parse the NS API JSON result into Trip objects, yielding each one as soon as it has been read.
 
-        https://gateway.apiportal.ns.nl/reisinformatie-api/api/v3/trips<parameters>
+        :param stream: 'raw' response from API, as file-like object or iterable of chunks
+        :param datetime requested_time: Timestamp to look up the possibilities for
+        :param bool lazy: only parse the parts and stops of a trip when they are first accessed
+        :raises:
+            - NoDataReceivedError when the NS API did not return data
+        """
+        skipped = {}
+        try:
+            for trip in JSONStreamReader(stream).iter_array(('trips',), skipped):
+                yield Trip(trip, requested_time, lazy=lazy)
+        except NoDataReceivedError:
+            if 'error' not in skipped:
+                raise
+            print(('Error in trips: ' + skipped['error']['message']))
 
-        :param str timestamp: departure time
-        :param str start: from station
-        :param str via: via station
-        :param str destination: Destination station
-        :param bool departure: if false departure time works as requested arrival time
-        :param int prev_advices: number of previous advices
-        :param int next_advices: number of next advices
+    @staticmethod
+    def _trips_url(timestamp, start, via, destination, departure=True, prev_advices=1, next_advices=1):
+        """Build the URL to fetch trip possibilities with; see get_trips.
+
+        :return: the URL and the requested time as timezone-aware datetime
+        :rtype: tuple
         """
-        timezone_string = '+0100'
-        if is_dst('Europe/Amsterdam'):
-            timezone_string = '+0200'
+        import urllib.parse
 
         if len(timestamp) == 5:
             # Format of HH:MM - api needs yyyy-mm-ddThh:mm
             timestamp = time.strftime('%Y-%m-%d') + 'T' + timestamp
-            # requested_time = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M")
-            # TODO: DST/normal time
-            requested_time = load_datetime(timestamp + timezone_string, '%Y-%m-%dT%H:%M%z')
+            local_time = datetime.fromisoformat(timestamp)
         else:
-            # requested_time = datetime.strptime(timestamp, "%d-%m-%Y %H:%M")
-            requested_time = load_datetime(timestamp + timezone_string, '%d-%m-%Y %H:%M%z')
-            timestamp = datetime.strptime(timestamp, '%d-%m-%Y %H:%M').strftime('%Y-%m-%dT%H:%M')
+            local_time = datetime.strptime(timestamp, '%d-%m-%Y %H:%M')
+            timestamp = local_time.strftime('%Y-%m-%dT%H:%M')
+        # The offset at the requested time itself, which differs from the current one across a DST change
+        requested_time = local_time.replace(tzinfo=local_offset_timezone(local_time))
 
         params = urllib.parse.urlencode(
             {
@@ -1093,9 +3840,65 @@ class NSAPI:
             }
         )
 
-        url = '/reisinformatie-api/api/v3/trips?%s' % params
-        raw_trips = self._request('GET', url)
-        return self.parse_trips(raw_trips, requested_time)
+        return '/reisinformatie-api/api/v3/trips?%s' % params, requested_time
+
+    def get_trips(
+        self,
+        timestamp,
+        start,
+        via,
+        destination,
+        departure=True,
+        prev_advices=1,
+        next_advices=1,
+        lazy=False,
+        deadline=None,
+        connect_timeout=None,
+        read_timeout=None,
+    ):
+        """Fetch trip possibilities for these parameters.
+
+        https://gateway.apiportal.ns.nl/reisinformatie-api/api/v3/trips<parameters>
+
+        :param str timestamp: departure time
+        :param str start: from station
+        :param str via: via station
+        :param str destination: Destination station
+        :param bool departure: if false departure time works as requested arrival time
+        :param int prev_advices: number of previous advices
+        :param int next_advices: number of next advices
+        :param bool lazy: only parse the parts and stops of a trip when they are first accessed
+        :param float deadline: maximum number of seconds the request may take, retries included; None for no limit
+        :param float connect_timeout: seconds to wait for a connection to be set up; defaults to that of the client
+        :param float read_timeout: seconds to wait for data from the API; defaults to that of the client
+        """
+        url, requested_time = self._trips_url(timestamp, start, via, destination, departure, prev_advices, next_advices)
+        return self._get(
+            'trips',
+            url,
+            lambda raw_trips: self.parse_trips(raw_trips, requested_time, lazy=lazy),
+            deadline,
+            lazy,
+            (connect_timeout, read_timeout),
+        )
+
+    def iter_trips(
+        self,
+        timestamp,
+        start,
+        via,
+        destination,
+        departure=True,
+        prev_advices=1,
+        next_advices=1,
+        lazy=False,
+    ):
+        """Fetch trip possibilities for these parameters, yielding each trip as soon as it has been read.
+
+        Unlike get_trips, this does not use the cache. See get_trips for the parameters.
+        """
+        url, requested_time = self._trips_url(timestamp, start, via, destination, departure, prev_advices, next_advices)
+        return self._iter_stream(url, self.parse_trips_stream, requested_time, lazy)
 
     @staticmethod
     def parse_stations(data):
@@ -1121,9 +3924,262 @@ class NSAPI:
 
         return stations
 
-    def get_stations(self):
-        """Fetch the list of stations."""
+    @staticmethod
+    def _stations_url():
+        """Build the URL to fetch the list of stations with."""
+        import urllib.parse
+
         params = urllib.parse.urlencode({})
-        url = '/reisinformatie-api/api/v2/stations?%s' % params
-        raw_stations = self._request('GET', url)
-        return self.parse_stations(raw_stations)
+        return '/reisinformatie-api/api/v2/stations?%s' % params
+
+    def get_stations(self, deadline=None, connect_timeout=None, read_timeout=None):
+        """Fetch the list of stations.
+
+        With a station_snapshot, the stations are read from its file and only fetched when there is none yet; a stale
+        snapshot is refreshed in the background.
+
+        :param float deadline: maximum number of seconds the request may take, retries included; None for no limit
+        :param float connect_timeout: seconds to wait for a connection to be set up; defaults to that of the client
+        :param float read_timeout: seconds to wait for data from the API; defaults to that of the client
+        """
+        if self.station_snapshot is not None:
+            return self.station_snapshot.get(
+                functools.partial(self._get_stations, deadline, connect_timeout, read_timeout)
+            )
+        return self._get_stations(deadline, connect_timeout, read_timeout)
+
+    def _get_stations(self, deadline=None, connect_timeout=None, read_timeout=None):
+        """Fetch the list of stations from the API; see get_stations."""
+        return self._get(
+            'stations', self._stations_url(), self.parse_stations, deadline, timeouts=(connect_timeout, read_timeout)
+        )
+
+    def get_station_index(self, deadline=None, connect_timeout=None, read_timeout=None):
+        """Fetch the list of stations as a StationIndex, for fast lookups by code or name.
+
+        :param float deadline: maximum number of seconds the request may take, retries included; None for no limit
+        :param float connect_timeout: seconds to wait for a connection to be set up; defaults to that of the client
+        :param float read_timeout: seconds to wait for data from the API; defaults to that of the client
+        """
+        return StationIndex(self.get_stations(deadline, connect_timeout, read_timeout))
+
+
+#######################
+# Departure board feed
+#######################
+
+
+class DepartureBoardPoller:
+    """Polls the departures of one station and reports only what changed since the previous poll.
+
+    The last list of departures is kept, indexed on the key of each departure, to compare the next one with.
+    """
+
+    def __init__(self, api, station=None, uic_code=None, max_journeys='25', source=None):
+        """Construct a DepartureBoardPoller object.
+
+        :param NSAPI api: library object to fetch the departures with
+        :param str station: station to lookup
+        :param str uic_code: specify a station by UIC code (84xxxxx)
+        :param str max_journeys: int32. number of departures or arrivals to return
+        :param str source: forces to use a certain source
+        """
+        self.api = api
+        self.station = station
+        self.uic_code = uic_code
+        self.max_journeys = max_journeys
+        self.source = source
+        self.departures = {}
+
+    def poll(self):
+        """Fetch the current departures and compare them with those of the previous poll; see update."""
+        departures = self.api.get_departures(
+            station=self.station,
+            max_journeys=self.max_journeys,
+            uic_code=self.uic_code,
+            source=self.source,
+        )
+        return self.update(departures)
+
+    def update(self, departures):
+        """Compare a list of departures with the previous one, and keep it for the next comparison.
+
+        On the first update all departures are reported as added.
+
+        :param list departures: current Departure objects of the station
+        :return: dictionary with the 'added' and 'removed' departures, and the 'changed' ones as (departure,
+            changes) tuples, where changes maps each changed attribute to its (old, new) values
+        :rtype: dict
+        """
+        current = {departure.key: departure for departure in departures}
+        delta = {'added': [], 'removed': [], 'changed': []}
+        for key, departure in current.items():
+            previous = self.departures.get(key)
+            if previous is None:
+                delta['added'].append(departure)
+            elif previous is not departure:
+                changes = state_changes(previous, departure)
+                if changes:
+                    delta['changed'].append((departure, changes))
+        for key, departure in self.departures.items():
+            if key not in current:
+                delta['removed'].append(departure)
+        self.departures = current
+        return delta
+
+
+#######################
+# Asynchronous library
+#######################
+
+
+class AsyncNSAPI:
+    """Asynchronous NS API object.
+
+    Library to query the official Dutch railways API from asyncio code. Mirrors NSAPI and uses its parsers.
+    """
+
+    def __init__(
+        self,
+        subscription_key,
+        max_connections=100,
+        idle_timeout=30,
+        rate_limiter=None,
+        retry=None,
+        connect_timeout=10,
+        read_timeout=30,
+    ):
+        """Construct the asynchronous NS API library object.
+
+        :param str subscription_key: NS API subscription key
+        :param int max_connections: maximum number of simultaneous keep-alive connections to the API
+        :param float idle_timeout: seconds after which an unused keep-alive connection is discarded
+        :param RateLimiter rate_limiter: optional limiter of the request rate, which can be shared between clients
+        :param RetryPolicy retry: when to repeat failed requests; defaults to RetryPolicy()
+        :param float connect_timeout: seconds to wait for a connection to the API to be set up; None waits forever
+        :param float read_timeout: seconds to wait for the complete response of the API; None waits forever
+        """
+        self.subscription_key = subscription_key
+        self.rate_limiter = rate_limiter
+        self.retry = RetryPolicy() if retry is None else retry
+        self._pool = AsyncConnectionPool(
+            NS_API_HOST,
+            max_connections=max_connections,
+            idle_timeout=idle_timeout,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+        )
+
+    async def close(self):
+        """Close the idle connections to the API."""
+        await self._pool.close()
+
+    async def __aenter__(self):
+        """Use the library object as async context manager, closing its connections on exit."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Close the connections to the API."""
+        await self.close()
+
+    async def _request(self, method, url, postdata=None, params=None):
+        """Make a request to the NS API.
+
+        :param str method: HTTP method ('GET' or 'POST')
+        :param str url: exact URL of the API endpoint
+        :param dict postdata: POST data
+        :param dict params: URL parameters
+        """
+        import asyncio
+
+        headers = {
+            # Request headers
+            'Ocp-Apim-Subscription-Key': self.subscription_key,
+            'Accept-Encoding': accept_encoding(),
+        }
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+            try:
+                status, response_headers, data = await self._pool.request(method, url, None, headers)
+                data = decode_content(data, response_headers.get('content-encoding'))
+                retry_after = parse_retry_after(response_headers.get('retry-after'))
+                if status not in self.retry.statuses or attempt >= self.retry.max_retries:
+                    return data.decode('UTF-8')
+            except (*retry_errors(), asyncio.TimeoutError) as e:
+                if attempt >= self.retry.max_retries:
+                    print('Error during connection: {0}'.format(e))
+                    return None
+                retry_after = None
+            except Exception as e:
+                print('Error during connection: {0}'.format(e))
+                return None
+            if retry_after is not None and self.rate_limiter is not None:
+                self.rate_limiter.pause(retry_after)
+            await asyncio.sleep(self.retry.delay(attempt, retry_after))
+            attempt += 1
+
+    async def get_disruptions(self, station=None, actual=True, unplanned=True):
+        """Fetch the current disruptions, or even the planned ones; see NSAPI.get_disruptions."""
+        raw_disruptions = await self._request('GET', NSAPI._disruptions_url(station, actual, unplanned))
+        return NSAPI.parse_disruptions(raw_disruptions)
+
+    async def get_departures(
+        self,
+        station=None,
+        for_datetime=None,
+        max_journeys='25',
+        uic_code=None,
+        source=None,
+    ):
+        """Fetch the current departure times from this station; see NSAPI.get_departures."""
+        url = NSAPI._departures_url(station, for_datetime, max_journeys, uic_code, source)
+        raw_departures = await self._request('GET', url)
+        return NSAPI.parse_departures(raw_departures)
+
+    async def get_trips(
+        self,
+        timestamp,
+        start,
+        via,
+        destination,
+        departure=True,
+        prev_advices=1,
+        next_advices=1,
+        lazy=False,
+    ):
+        """Fetch trip possibilities for these parameters; see NSAPI.get_trips."""
+        url, requested_time = NSAPI._trips_url(
+            timestamp, start, via, destination, departure, prev_advices, next_advices
+        )
+        raw_trips = await self._request('GET', url)
+        return NSAPI.parse_trips(raw_trips, requested_time, lazy=lazy)
+
+    async def get_stations(self):
+        """Fetch the list of stations."""
+        raw_stations = await self._request('GET', NSAPI._stations_url())
+        return NSAPI.parse_stations(raw_stations)
+
+    async def get_departures_bulk(self, stations, max_concurrency=50, **kwargs):
+        """Fetch the departures for a number of stations concurrently.
+
+        A failure for one station does not abort the others; its exception is returned in place of its departures.
+
+        :param list stations: station codes to look up
+        :param int max_concurrency: maximum number of requests in flight at the same time
+        :param kwargs: further arguments for get_departures, applied to every station
+        :return: the departures per station code, or the exception raised for that station
+        :rtype: dict
+        """
+        import asyncio
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch(station):
+            async with semaphore:
+                return await self.get_departures(station, **kwargs)
+
+        stations = list(stations)
+        results = await asyncio.gather(*(fetch(station) for station in stations), return_exceptions=True)
+        return dict(zip(stations, results))
@@ -0,0 +1,71 @@
+"""Regression checks for reading JSON responses as a stream."""
+
+import io
+import json
+import threading
+
+import pytest
+
+from ns_api import NSAPI, JSONStreamReader, NoDataReceivedError
+
+DEPARTURES = json.dumps(
+    {
+        'payload': {
+            'source': 'PPV',
+            'departures': [{'name': 'NS 1', 'plannedDateTime': '2024-01-31T12:34:00+0100'} for _ in range(3)],
+        }
+    }
+)
+
+
+def run_with_timeout(function, timeout=5):
+    """Run function in a thread, failing the test instead of hanging when it does not finish in time."""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = function()
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'reading the stream did not finish'
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+@pytest.mark.parametrize('stream_class, data', [(io.StringIO, DEPARTURES), (io.BytesIO, DEPARTURES.encode())])
+def test_file_like_stream(stream_class, data):
+    """Text and binary file objects are read to the end of the array."""
+    items = run_with_timeout(lambda: list(JSONStreamReader(stream_class(data)).iter_array(('payload', 'departures'))))
+    assert len(items) == 3
+
+
+@pytest.mark.parametrize('stream_class, data', [(io.StringIO, ''), (io.BytesIO, b'')])
+def test_empty_file_like_stream(stream_class, data):
+    """An empty file object raises instead of waiting for more data forever."""
+    with pytest.raises(NoDataReceivedError):
+        run_with_timeout(lambda: list(NSAPI.parse_departures_stream(stream_class(data))))
+
+
+# Cut off before the departures array is complete; what comes after the array is never read
+TRUNCATED_LENGTHS = [1, 12, 28, DEPARTURES.index('[') + 1, len(DEPARTURES) // 2, DEPARTURES.rindex(']')]
+
+
+@pytest.mark.parametrize('length', TRUNCATED_LENGTHS)
+@pytest.mark.parametrize('stream_class', [io.StringIO, io.BytesIO])
+def test_truncated_file_like_stream(stream_class, length):
+    """A file object that ends halfway raises instead of hanging."""
+    data = DEPARTURES[:length]
+    stream = stream_class(data if stream_class is io.StringIO else data.encode())
+    with pytest.raises((ValueError, NoDataReceivedError)):
+        run_with_timeout(lambda: list(JSONStreamReader(stream).iter_array(('payload', 'departures'))))
+
+
+def test_missing_array():
+    """A response without the departures array raises."""
+    with pytest.raises(NoDataReceivedError):
+        run_with_timeout(lambda: list(NSAPI.parse_departures_stream(io.StringIO('{"payload": {}}'))))